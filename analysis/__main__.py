@@ -0,0 +1,104 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.extend([os.getcwd()])
+from models import *
+from pagerank import authority, in_degree, pagerank
+from storage.graph_file import LinkGraph
+from storage.graph_snapshots import graph_timestamps, load_graph
+from storage.index_file import IndexReader
+from storage.ranks import write_ranks
+from storage.segments import SegmentManifest
+
+logger: logging.Logger = logging.getLogger("Analysis")
+
+
+def latest_graph(graph_dir: str, profile_name: str) -> Optional[str]:
+    # Timestamps sort chronologically; full files and snapshots both count
+    timestamps: List[str] = graph_timestamps(graph_dir, profile_name)
+    return timestamps[-1] if timestamps else None
+
+
+def analyze(graph_dir: str, profile_name: str, timestamp: str) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+    t_start = time.perf_counter()
+    graph: LinkGraph = load_graph(graph_dir, profile_name, timestamp)
+    t_load = time.perf_counter() - t_start
+
+    scores = authority(pagerank(graph))
+    degrees = in_degree(graph)
+    logger.info(
+        "Analyzed %s/%s: %d nodes, %d edges (load %.2fs, rank %.2fs)",
+        timestamp,
+        profile_name,
+        graph.n_nodes(),
+        graph.n_edges(),
+        t_load,
+        time.perf_counter() - t_start - t_load,
+    )
+    return graph.ids, scores, degrees
+
+
+def write_segments(crawlopts: CrawlConfig, graphs: List[Tuple[Dict[str, int], np.ndarray, np.ndarray]]):
+    manifest = SegmentManifest.load(crawlopts.index)
+    for path in manifest.paths():
+        reader = IndexReader(path)
+        scores: array = array("f", bytes(4 * reader.n_docs))
+        degrees: array = array("I", bytes(4 * reader.n_docs))
+
+        # Urls crawled by several profiles keep their best score
+        for doc_id in range(reader.n_docs):
+            info = reader.doc_info(doc_id)
+            if info is None:
+                continue
+
+            for ids, graph_scores, graph_degrees in graphs:
+                node: Optional[int] = ids.get(info[0])
+                if node is not None:
+                    scores[doc_id] = max(scores[doc_id], graph_scores[node])
+                    degrees[doc_id] = max(degrees[doc_id], int(graph_degrees[node]))
+
+        write_ranks(path, scores, degrees)
+        reader.close()
+        logger.info("Wrote link scores for %s", path)
+
+    # A new generation makes search servers reload with the new scores
+    manifest.generation += 1
+    manifest.save()
+
+
+def main(args):
+    crawlopts = CrawlConfig.load_config(args.config, make_dirs=False)
+    profiles = ProfileConfig.load_profiles(args.config)
+
+    logging.basicConfig(
+        filename=crawlopts.log_file,
+        level=logging.DEBUG if crawlopts.debug else logging.INFO,
+        force=True,
+        format=LOGGING_FORMAT,
+    )
+
+    graphs = []
+    for profile in profiles:
+        timestamp: Optional[str] = latest_graph(crawlopts.graph_dir, profile.profile_name)
+        if timestamp is None:
+            logger.warning("No graph for profile %s", profile.profile_name)
+            continue
+        graphs.append(analyze(crawlopts.graph_dir, profile.profile_name, timestamp))
+
+    write_segments(crawlopts, graphs)
+    print(f"Link scores written for {len(graphs)} profiles")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-config", help="Path to the config file", required=True)
+
+    args = parser.parse_args()
+    main(args)
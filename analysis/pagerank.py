@@ -0,0 +1,67 @@
+import logging
+from typing import Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from storage.graph_file import LinkGraph
+
+logger: logging.Logger = logging.getLogger("Analysis")
+
+DAMPING = 0.85
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 100
+
+
+def adjacency(graph: LinkGraph) -> Tuple[sp.csr_matrix, np.ndarray]:
+    # Column stochastic transition matrix (row = target) and out-degrees
+    n: int = graph.n_nodes()
+    sources = np.frombuffer(graph.sources, dtype=np.uint32)
+    targets = np.frombuffer(graph.targets, dtype=np.uint32)
+
+    out_degree = np.bincount(sources, minlength=n).astype(np.float64)
+    weights = 1.0 / out_degree[sources]
+    matrix = sp.csr_matrix((weights, (targets, sources)), shape=(n, n))
+    return matrix, out_degree
+
+
+def pagerank(
+    graph: LinkGraph,
+    damping: float = DAMPING,
+    tolerance: float = TOLERANCE,
+    max_iterations: int = MAX_ITERATIONS,
+) -> np.ndarray:
+    n: int = graph.n_nodes()
+    if n == 0:
+        return np.zeros(0)
+
+    matrix, out_degree = adjacency(graph)
+    dangling = out_degree == 0
+
+    # Power iteration; rank of pages without links is spread evenly
+    rank = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iterations + 1):
+        spread: float = rank[dangling].sum() / n
+        updated = damping * (matrix @ rank + spread) + (1 - damping) / n
+        error: float = np.abs(updated - rank).sum()
+        rank = updated
+        if error < n * tolerance:
+            logger.debug("PageRank converged after %d iterations", iteration)
+            break
+    else:
+        logger.warning("PageRank did not converge in %d iterations", max_iterations)
+
+    return rank
+
+
+def in_degree(graph: LinkGraph) -> np.ndarray:
+    targets = np.frombuffer(graph.targets, dtype=np.uint32)
+    return np.bincount(targets, minlength=graph.n_nodes())
+
+
+def authority(rank: np.ndarray) -> np.ndarray:
+    # Log scaled to 0..1, so a few hubs do not flatten every other page
+    if len(rank) == 0:
+        return rank
+    scaled = np.log1p(rank * len(rank))
+    return scaled / max(scaled.max(), 1e-12)
@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import ujson as json
+
+sys.path.extend([os.getcwd()])
+sys.path.extend(os.path.join(os.getcwd(), name) for name in ("crawler", "indexing", "search_engine"))
+from models import *
+from synthetic_site import SyntheticSite, serve
+from storage.packfile import PackStore
+from tokenization import benchmark
+from worker import Crawler
+from indexer import IndexManager
+from search import Search
+
+logger: logging.Logger = logging.getLogger("Benchmark")
+
+HOST = "127.0.0.1"
+PROFILE_NAME = "benchmark"
+
+# Seconds to wait for the synthetic site to report its port
+SERVER_TIMEOUT = 10
+
+
+def peak_rss() -> Dict[str, float]:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale: int = 1 << 10 if sys.platform != "darwin" else 1 << 20
+    return {
+        "self_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def run_stage(conn, stage: Callable[..., Dict], crawlopts: CrawlConfig, args: tuple):
+    # Spawned processes start without the parent's logging setup
+    logging.basicConfig(
+        filename=crawlopts.log_file,
+        level=logging.INFO,
+        force=True,
+        format=LOGGING_FORMAT,
+    )
+
+    result = stage(crawlopts, *args)
+    # Children here are only the stage's own pool workers, not the site server
+    result["peak_rss"] = peak_rss()
+    conn.send(result)
+    conn.close()
+
+
+def isolated(stage: Callable[..., Dict], crawlopts: CrawlConfig, *args) -> Dict:
+    # ru_maxrss only ever grows, so each stage gets a fresh process of its own
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=run_stage, args=(child, stage, crawlopts, args))
+    process.start()
+    child.close()
+    try:
+        return parent.recv()
+    except EOFError:
+        raise RuntimeError(f"Benchmark stage {stage.__name__} failed") from None
+    finally:
+        process.join()
+
+
+def dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def start_site(site: SyntheticSite):
+    # The site binds a free port and reports it, so nothing else can answer for it
+    parent, child = multiprocessing.Pipe(duplex=False)
+    server = multiprocessing.Process(target=serve, args=(site, HOST, child), daemon=True)
+    server.start()
+    child.close()
+
+    if not parent.poll(SERVER_TIMEOUT):
+        server.terminate()
+        raise TimeoutError("Synthetic site did not start")
+    return server, parent.recv()
+
+
+def make_config(args, workdir: str) -> CrawlConfig:
+    return CrawlConfig(
+        {
+            "log_file": os.path.join(workdir, "benchmark.log"),
+            "database_location": os.path.join(workdir, "databases"),
+            "debug": False,
+            "profile": False,
+            "cache_dir": os.path.join(workdir, "data"),
+            "graph_dir": os.path.join(workdir, "graphs"),
+            "index": os.path.join(workdir, "index"),
+            "frontier_dir": os.path.join(workdir, "frontier"),
+            "checkpoint_dir": os.path.join(workdir, "checkpoints"),
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "tokenizer": args.tokenizer,
+            "positions": args.positions,
+            # Every query is timed, not answered from the cache
+            "query_cache": 0,
+        }
+    )
+
+
+def make_profile(args, port: int) -> ProfileConfig:
+    base: str = f"http://{HOST}:{port}"
+    return ProfileConfig(
+        PROFILE_NAME,
+        {
+            "locations": [f"{base}/page/0"],
+            "depth": args.pages,
+            "filter": [],
+            "match": [f"^{base}/page/.*"],
+        },
+    )
+
+
+def bench_crawl(crawlopts: CrawlConfig, profile: ProfileConfig) -> Dict[str, float]:
+    if sys.platform == "linux":
+        import uvloop
+        uvloop.install()
+
+    t_start = time.perf_counter()
+    asyncio.run(Crawler(crawlopts, [profile]).run())
+    t_taken = time.perf_counter() - t_start
+
+    with sqlite3.connect(os.path.join(crawlopts.database_dir, f"{PROFILE_NAME}.db")) as conn:
+        (pages,) = conn.execute("SELECT COUNT(*) FROM URLProfileData").fetchone()
+
+    return {
+        "pages": pages,
+        "seconds": t_taken,
+        "pages_per_sec": pages / t_taken if t_taken else 0.0,
+        "cache_bytes": dir_size(crawlopts.cache_dir),
+    }
+
+
+def bench_tokenize(crawlopts: CrawlConfig) -> Dict[str, float]:
+    store = PackStore(crawlopts.cache_dir)
+    sample = [store.get(hash) for hash in store.hashes()]
+    store.close()
+    return benchmark(sample, [crawlopts.tokenizer])[crawlopts.tokenizer]
+
+
+def bench_index(crawlopts: CrawlConfig, profile: ProfileConfig) -> Dict[str, float]:
+    t_start = time.perf_counter()
+    manager = IndexManager(crawlopts, [profile])
+    manager.process()
+    manager.save()
+    t_taken = time.perf_counter() - t_start
+
+    return {
+        "documents": len(manager.doc_hashes),
+        "seconds": t_taken,
+        "stages": dict(manager.timings),
+        "index_bytes": dir_size(crawlopts.index),
+    }
+
+
+def make_queries(site: SyntheticSite, count: int, positions: bool) -> List[str]:
+    # Frequent and rare words, pairs, and (with positions) phrases
+    rng = random.Random(site.seed)
+    queries: List[str] = []
+    for i in range(count):
+        words: List[str] = rng.choices(site.words, site.weights, k=2)
+        if positions and i % 4 == 3:
+            queries.append(f'"{words[0]} {words[1]}"')
+        elif i % 2:
+            queries.append(" ".join(words))
+        else:
+            queries.append(rng.choice(site.words))
+    return queries
+
+
+def bench_search(crawlopts: CrawlConfig, queries: List[str]) -> Dict[str, float]:
+    t_start = time.perf_counter()
+    searcher = Search(crawlopts)
+    t_load = time.perf_counter() - t_start
+
+    latencies: List[float] = []
+    for query in queries:
+        t_query = time.perf_counter()
+        searcher.search(query)
+        latencies.append((time.perf_counter() - t_query) * 1e3)
+
+    percentiles: List[float] = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "queries": len(latencies),
+        "load_seconds": t_load,
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": percentiles[49],
+        "p99_ms": percentiles[98],
+    }
+
+
+def run(args, workdir: str) -> Dict:
+    crawlopts = make_config(args, workdir)
+    site = SyntheticSite(args.pages, args.fanout, args.page_size, args.latency / 1e3, args.seed)
+
+    logging.basicConfig(
+        filename=crawlopts.log_file,
+        level=logging.INFO,
+        force=True,
+        format=LOGGING_FORMAT,
+    )
+
+    server, port = start_site(site)
+    profile = make_profile(args, port)
+    try:
+        logger.info("Benchmarking %d pages in %s", args.pages, workdir)
+        results = {
+            "config": {
+                "pages": args.pages,
+                "fanout": args.fanout,
+                "page_size": args.page_size,
+                "latency_ms": args.latency,
+                "seed": args.seed,
+                "concurrency": args.concurrency,
+                "workers": args.workers,
+                "tokenizer": args.tokenizer,
+                "positions": args.positions,
+            },
+            "crawl": isolated(bench_crawl, crawlopts, profile),
+        }
+    finally:
+        server.terminate()
+        server.join()
+
+    results["tokenize"] = isolated(bench_tokenize, crawlopts)
+    results["index"] = isolated(bench_index, crawlopts, profile)
+    results["search"] = isolated(bench_search, crawlopts, make_queries(site, args.queries, args.positions))
+    return results
+
+
+def main(args):
+    workdir: str = args.workdir or tempfile.mkdtemp(prefix="webcrawler-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    # A temporary workdir is removed even when a stage fails
+    try:
+        results = run(args, workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output: str = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-pages", help="Pages on the synthetic site", type=int, default=2000)
+    parser.add_argument("-fanout", help="Links per page", type=int, default=10)
+    parser.add_argument("-page-size", help="Approximate page size in bytes", type=int, default=20000)
+    parser.add_argument("-latency", help="Response delay in milliseconds", type=float, default=0)
+    parser.add_argument("-seed", help="Seed for the site and queries", type=int, default=0)
+    parser.add_argument("-queries", help="Search queries to time", type=int, default=500)
+    parser.add_argument("-concurrency", help="Concurrent requests", type=int, default=32)
+    parser.add_argument("-workers", help="Indexing workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-tokenizer", help="Tokenizer to index with", default="fast")
+    parser.add_argument(
+        "-positions", help="Build a positional index and time phrase queries", action="store_true"
+    )
+    parser.add_argument("-workdir", help="Keep crawl data and the index here (default: temporary)")
+    parser.add_argument("-output", help="Also write the JSON results to this file")
+
+    args = parser.parse_args()
+    main(args)
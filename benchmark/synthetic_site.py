@@ -0,0 +1,84 @@
+import asyncio
+import html
+import random
+import socket
+from multiprocessing.connection import Connection
+from typing import List
+
+from aiohttp import web
+
+# Deterministic synthetic site: page i is generated from (seed, i) alone, so
+# every run (and every release) crawls exactly the same pages and links.
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vi", "so", "pe", "da", "gu", "zo", "be", "fi"]
+VOCABULARY_SIZE = 2000
+
+
+def vocabulary(seed: int) -> List[str]:
+    rng = random.Random(seed)
+    words: List[str] = []
+    seen = set()
+    while len(words) < VOCABULARY_SIZE:
+        word: str = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+class SyntheticSite:
+    def __init__(self, pages: int, fanout: int, page_size: int, latency: float, seed: int = 0) -> None:
+        self.pages: int = pages
+        self.fanout: int = fanout
+        self.page_size: int = page_size
+        self.latency: float = latency
+        self.seed: int = seed
+
+        # Zipf-like word frequencies, like natural text
+        self.words: List[str] = vocabulary(seed)
+        self.weights: List[float] = [1 / (rank + 1) for rank in range(len(self.words))]
+
+    def links(self, page: int) -> List[int]:
+        # The next page keeps every page reachable; the rest are random
+        rng = random.Random(self.seed * 1_000_003 + page)
+        return [(page + 1) % self.pages] + [rng.randrange(self.pages) for _ in range(self.fanout - 1)]
+
+    def render(self, page: int) -> str:
+        rng = random.Random(self.seed * 1_000_003 + page)
+        title: str = " ".join(rng.choices(self.words, self.weights, k=3))
+
+        parts: List[str] = [f"<html><head><title>{html.escape(title)}</title></head><body>"]
+        parts.extend(f'<a href="/page/{target}">link {target}</a>' for target in self.links(page))
+
+        size: int = sum(map(len, parts))
+        while size < self.page_size:
+            paragraph: str = "<p>" + " ".join(rng.choices(self.words, self.weights, k=60)) + "</p>"
+            parts.append(paragraph)
+            size += len(paragraph)
+
+        parts.append("<script>var ignored = 1;</script></body></html>")
+        return "".join(parts)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        page: int = int(request.match_info["page"])
+        if not 0 <= page < self.pages:
+            raise web.HTTPNotFound()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(text=self.render(page), content_type="text/html")
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/page/{page:\\d+}", self.handle)
+        return app
+
+
+def serve(site: SyntheticSite, host: str, conn: Connection):
+    # Runs in its own process, so serving does not compete with the crawler's loop.
+    # Listens on a free port before reporting it, so the first requests just queue.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, 0))
+    sock.listen(128)
+    conn.send(sock.getsockname()[1])
+    conn.close()
+    web.run_app(site.app(), sock=sock, print=None, access_log=None)
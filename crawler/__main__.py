@@ -4,6 +4,7 @@ import logging
 import toml
 import os
 import cProfile
+from metrics import StageProfiler
 from worker import Crawler
 from models import *
 import sys
@@ -33,13 +34,15 @@ def main(args):
     logger = logging.getLogger("CrawlerMain")
     logger.info("Preparing to crawl ...")
 
+    # Unknown stages fail before the crawl starts
+    StageProfiler(crawlopts.profile, crawlopts.parse_pool)
     profiler = cProfile.Profile()
 
-    if crawlopts.profile:
-        logging.info("Profiling (profile = true) ...")
+    if "loop" in crawlopts.profile:
+        logging.info("Profiling the whole event loop (profile = [\"loop\"]) ...")
         profiler.enable()
 
-    c = Crawler(crawlopts, profileopts)
+    c = Crawler(crawlopts, profileopts, args.resume)
 
     if sys.platform == 'linux':
         import uvloop
@@ -47,7 +50,7 @@ def main(args):
 
     asyncio.run(c.run())
 
-    if crawlopts.profile:
+    if "loop" in crawlopts.profile:
         profiler.disable()
         logging.info("Stopping profiler and saving stats to 'profile.perf'")
         profiler.dump_stats("profile.perf")
@@ -56,5 +59,11 @@ def main(args):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-config", required=True)
+    parser.add_argument(
+        "-resume",
+        help="Continue from the last checkpoint",
+        required=False,
+        action="store_true",
+    )
     args = parser.parse_args()
     main(args)
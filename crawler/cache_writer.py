@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Set, Tuple
+
+from models import CrawlConfig
+from metrics import Metrics
+from storage.packfile import PackStore
+
+logger: logging.Logger = logging.getLogger("CacheWriter")
+
+
+class CacheWriter:
+    def __init__(self, crawlopts: CrawlConfig, metrics: Metrics) -> None:
+        self.crawlopts: CrawlConfig = crawlopts
+        self.metrics: Metrics = metrics
+        self.store: PackStore = PackStore(crawlopts.cache_dir, crawlopts.pack_size)
+
+        # Bounded: `put` blocks the crawl when the disk falls behind
+        self.queue: asyncio.Queue[Tuple[str, bytes, asyncio.Future]] = asyncio.Queue(
+            maxsize=crawlopts.cache_queue
+        )
+        self.tasks: List[asyncio.Task] = []
+
+        # Unfinished writes per profile, so checkpoints wait only for their own pages
+        self.pending: Dict[str, Set[asyncio.Future]] = {}
+        metrics.add_queue("cache", self.queue.qsize)
+
+        # Stats
+        self.files: int = 0
+        self.skipped: int = 0
+        self.bytes_written: int = 0
+        self.t_start: float = time.perf_counter()
+        self.t_report: float = self.t_start
+
+    def start(self):
+        self.t_start = self.t_report = time.perf_counter()
+        self.tasks = [
+            asyncio.create_task(self.writer())
+            for _ in range(self.crawlopts.cache_writers)
+        ]
+
+    async def put(self, hash_str: str, data: bytes, owner: str = ""):
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        pending: Set[asyncio.Future] = self.pending.setdefault(owner, set())
+        pending.add(future)
+        future.add_done_callback(pending.discard)
+        await self.queue.put((hash_str, data, future))
+
+    def pending_writes(self, owner: str = "") -> List[asyncio.Future]:
+        return list(self.pending.get(owner, ()))
+
+    async def write(self, hash_str: str, data: bytes):
+        with self.metrics.timer("cache"):
+            written: bool = await asyncio.get_running_loop().run_in_executor(
+                None, self.store.put, hash_str, data
+            )
+        if not written:
+            self.skipped += 1
+            return
+
+        self.files += 1
+        self.bytes_written += len(data)
+
+    async def writer(self):
+        while True:
+            hash_str, data, future = await self.queue.get()
+            try:
+                await self.write(hash_str, data)
+            except Exception as err:
+                logger.error("Failed to cache %s with error %s", hash_str, err)
+            finally:
+                if not future.done():
+                    future.set_result(None)
+                self.queue.task_done()
+
+            if time.perf_counter() - self.t_report > 30:
+                self.t_report = time.perf_counter()
+                self.report()
+
+    def report(self):
+        t_taken = max(time.perf_counter() - self.t_start, 1e-9)
+        logger.info(
+            "Cached %d pages (%d skipped), %.2f MB written, %.2f MB on disk, %.2f MB/s, %d queued",
+            self.files,
+            self.skipped,
+            self.bytes_written / 1e6,
+            self.store.size() / 1e6,
+            self.bytes_written / 1e6 / t_taken,
+            self.queue.qsize(),
+        )
+
+    async def drain(self):
+        await self.queue.join()
+
+    async def close(self):
+        # Drain pending writes, then stop the writers
+        await self.drain()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.report()
+        self.store.close()
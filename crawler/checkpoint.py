@@ -0,0 +1,82 @@
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import ujson as json
+
+from models import CrawlConfig
+
+logger: logging.Logger = logging.getLogger("Checkpoint")
+
+MANIFEST_NAME = "checkpoint.json"
+
+
+class Checkpoint:
+    def __init__(self, crawlopts: CrawlConfig) -> None:
+        self.crawlopts: CrawlConfig = crawlopts
+        self.root: str = crawlopts.checkpoint_dir
+        self.manifest: Dict[str, Any] = {}
+
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def path(self, profile_name: str, generation: int, suffix: str) -> str:
+        return os.path.join(self.root, f"{profile_name}.{generation}.{suffix}")
+
+    def start(self):
+        self.clear()
+        self.manifest = {
+            "timestamp": self.crawlopts.timestamp,
+            "unix_time": self.crawlopts.unix_time,
+            "profiles": {},
+        }
+        self.write()
+
+    def load(self) -> bool:
+        if not os.path.exists(self.manifest_path()):
+            logger.warning("No checkpoint in %s, starting a new crawl", self.root)
+            self.start()
+            return False
+
+        with open(self.manifest_path()) as fd:
+            self.manifest = json.load(fd)
+
+        # Continue the interrupted crawl (same graph folder and timestamps)
+        unused: str = self.crawlopts.graph_ts_dir
+        self.crawlopts.timestamp = self.manifest["timestamp"]
+        self.crawlopts.unix_time = self.manifest["unix_time"]
+        self.crawlopts.graph_ts_dir = os.path.join(
+            self.crawlopts.graph_dir, self.crawlopts.timestamp
+        )
+        os.makedirs(self.crawlopts.graph_ts_dir, exist_ok=True)
+
+        if unused != self.crawlopts.graph_ts_dir and os.path.isdir(unused) and not os.listdir(unused):
+            os.rmdir(unused)
+
+        logger.info("Resuming crawl started at %s", self.crawlopts.timestamp)
+        return True
+
+    def state(self, profile_name: str) -> Optional[Dict[str, Any]]:
+        return self.manifest["profiles"].get(profile_name)
+
+    def update(self, profile_name: str, state: Dict[str, Any]):
+        previous: Optional[Dict[str, Any]] = self.state(profile_name)
+        self.manifest["profiles"][profile_name] = state
+        self.write()
+
+        # Drop files of the previous generation once the manifest points past them
+        if previous is not None and previous["generation"] != state["generation"]:
+            for suffix in ("frontier", "graph"):
+                path = self.path(profile_name, previous["generation"], suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def write(self):
+        tmp: str = self.manifest_path() + ".tmp"
+        with open(tmp, "w") as fd:
+            json.dump(self.manifest, fd)
+        os.replace(tmp, self.manifest_path())
+
+    def clear(self):
+        for name in os.listdir(self.root):
+            os.remove(os.path.join(self.root, name))
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Row, insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from models import CrawlConfig, URLData
+from metrics import Metrics
+
+logger: logging.Logger = logging.getLogger("DBWriter")
+
+
+class BulkWriter:
+    def __init__(self, engine: AsyncEngine, crawlopts: CrawlConfig, metrics: Metrics) -> None:
+        self.engine: AsyncEngine = engine
+        self.crawlopts: CrawlConfig = crawlopts
+        self.metrics: Metrics = metrics
+
+        self.rows: List[Dict[str, Any]] = []
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.written: int = 0
+        self.t_flush: float = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self.ticker())
+
+    async def add(self, **row: Any):
+        self.rows.append(row)
+        if len(self.rows) >= self.crawlopts.db_batch:
+            try:
+                await self.flush()
+            except Exception as err:
+                # The page itself was crawled; its row stays queued
+                logger.error("Insert failed with %s (%d rows kept)", err, len(self.rows))
+
+    async def ticker(self):
+        # Flush at least every `db_interval` seconds
+        while True:
+            await asyncio.sleep(self.crawlopts.db_interval)
+            try:
+                await self.flush()
+            except Exception as err:
+                logger.error("Periodic insert failed with %s (%d rows kept)", err, len(self.rows))
+
+    async def flush(self):
+        async with self.lock:
+            rows, self.rows = self.rows, []
+            if not rows:
+                return
+
+            t_start = time.perf_counter()
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(insert(URLData), rows)
+            except Exception:
+                # Retried with the next flush, ahead of rows added meanwhile
+                self.rows[:0] = rows
+                raise
+
+            t_taken = time.perf_counter() - t_start
+            self.metrics.observe("db", t_taken)
+            self.t_flush += t_taken
+            self.written += len(rows)
+            logger.debug("Inserted %d rows", len(rows))
+
+    async def previous(self, url: str) -> Optional[Row]:
+        # Latest stored version of a page (incremental crawls)
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(
+                    URLData.hash,
+                    URLData.title,
+                    URLData.etag,
+                    URLData.last_modified,
+                    URLData.links,
+                )
+                .where(URLData.url == url)
+                .order_by(URLData.time.desc())
+                .limit(1)
+            )
+            return result.first()
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+        await self.flush()
+        logger.info("Inserted %d rows in %.2fs", self.written, self.t_flush)
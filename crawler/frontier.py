@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import math
+import os
+import shutil
+import sqlite3
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import ujson as json
+
+from models import CrawlConfig, ProfileConfig
+
+logger: logging.Logger = logging.getLogger("Frontier")
+
+# Rows moved between SQLite and memory at once
+CHUNK_SIZE = 1000
+
+
+# Workers finish out of depth order, so a url can first be found through a
+# longer path. A shorter path found later queues it again at the lower depth
+# (its links may now be in range), and the deeper entry is skipped when popped.
+class MemoryFrontier:
+    def __init__(self, profile: ProfileConfig, crawlopts: CrawlConfig) -> None:
+        self.queue: Deque[Tuple[str, int]] = deque()
+        # Url -> lowest depth it was found at
+        self.visited: Dict[str, int] = {}
+
+    def push(self, url: str, depth: int) -> bool:
+        previous: Optional[int] = self.visited.get(url)
+        if previous is not None and previous <= depth:
+            return False
+
+        self.visited[url] = depth
+        self.queue.append((url, depth))
+        return True
+
+    def pop(self) -> Optional[Tuple[str, int]]:
+        while self.queue:
+            url, depth = self.queue.popleft()
+            if depth <= self.visited.get(url, depth):
+                return url, depth
+        return None
+
+    def seen(self) -> int:
+        return len(self.visited)
+
+    def save(self, dest: str, pending: List[Tuple[str, int]]):
+        tmp: str = dest + ".tmp"
+        with open(tmp, "w") as fd:
+            json.dump(
+                {"queue": pending + list(self.queue), "visited": self.visited}, fd
+            )
+        os.replace(tmp, dest)
+
+    def restore(self, src: str):
+        with open(src) as fd:
+            state = json.load(fd)
+
+        self.queue = deque((url, depth) for url, depth in state["queue"])
+        self.visited = state["visited"]
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def close(self):
+        pass
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        self.size: int = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes: int = max(1, round(self.size / capacity * math.log(2)))
+        self.bits: bytearray = bytearray((self.size + 7) // 8)
+
+    def positions(self, key: int):
+        # Double hashing over the 64 bit url hash
+        h1, h2 = key & 0xFFFFFFFF, key >> 32
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: int):
+        for pos in self.positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: int) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(key))
+
+
+# Large crawl mode: the queue lives in SQLite and visited urls are kept as
+# 64 bit hashes, so memory stays bounded by the chunk buffers and the bloom filter.
+class DiskFrontier:
+    def __init__(self, profile: ProfileConfig, crawlopts: CrawlConfig) -> None:
+        self.path: str = os.path.join(
+            crawlopts.frontier_dir, f"{profile.profile_name}.frontier.db"
+        )
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        self.db: sqlite3.Connection = self.connect()
+
+        self.bloom_capacity: int = profile.bloom_capacity
+        self.bloom: Optional[BloomFilter] = None
+        if self.bloom_capacity:
+            self.bloom = BloomFilter(self.bloom_capacity)
+
+        # Buffers, flushed in chunks (hash -> lowest depth)
+        self.pushed: List[Tuple[str, int]] = []
+        self.new_hashes: Dict[int, int] = {}
+
+        # Urls queued again at a lower depth, so their deeper entries are skipped
+        self.requeued: Dict[int, int] = {}
+        self.popped: Deque[Tuple[str, int]] = deque()
+        self.queued: int = 0
+        self.visited: int = 0
+
+    def connect(self) -> sqlite3.Connection:
+        db: sqlite3.Connection = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode = WAL;")
+        db.execute("PRAGMA synchronous = OFF;")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY, url TEXT, depth INTEGER)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS visited (hash INTEGER PRIMARY KEY, depth INTEGER)")
+        return db
+
+    @staticmethod
+    def url_hash(url: str) -> int:
+        digest: bytes = hashlib.blake2b(url.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little", signed=True)
+
+    def visited_depth(self, key: int) -> Optional[int]:
+        if key in self.new_hashes:
+            return self.new_hashes[key]
+
+        # Definitely new: skip the lookup
+        if self.bloom is not None and key not in self.bloom:
+            return None
+
+        row = self.db.execute("SELECT depth FROM visited WHERE hash = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def push(self, url: str, depth: int) -> bool:
+        key: int = DiskFrontier.url_hash(url)
+        previous: Optional[int] = self.visited_depth(key)
+        if previous is not None and previous <= depth:
+            return False
+
+        if previous is None:
+            if self.bloom is not None:
+                self.bloom.add(key)
+            self.visited += 1
+        else:
+            self.requeued[key] = depth
+
+        self.new_hashes[key] = depth
+        self.pushed.append((url, depth))
+        self.queued += 1
+
+        if len(self.pushed) >= CHUNK_SIZE:
+            self.flush()
+        return True
+
+    def flush(self):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO visited (hash, depth) VALUES (?, ?)",
+                self.new_hashes.items(),
+            )
+            self.db.executemany(
+                "INSERT INTO queue (url, depth) VALUES (?, ?)", self.pushed
+            )
+        self.new_hashes.clear()
+        self.pushed.clear()
+
+    def pop(self) -> Optional[Tuple[str, int]]:
+        while True:
+            if not self.popped:
+                self.flush()
+                rows = self.db.execute(
+                    "SELECT id, url, depth FROM queue ORDER BY id LIMIT ?", (CHUNK_SIZE,)
+                ).fetchall()
+                if not rows:
+                    return None
+
+                with self.db:
+                    self.db.execute("DELETE FROM queue WHERE id <= ?", (rows[-1][0],))
+                self.popped.extend((url, depth) for _, url, depth in rows)
+
+            self.queued -= 1
+            url, depth = self.popped.popleft()
+
+            # Hashed only while some url has been queued twice
+            if not self.requeued or depth <= self.requeued.get(DiskFrontier.url_hash(url), depth):
+                return url, depth
+
+    def seen(self) -> int:
+        return self.visited
+
+    def save(self, dest: str, pending: List[Tuple[str, int]]):
+        self.flush()
+
+        tmp: str = dest + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        backup: sqlite3.Connection = sqlite3.connect(tmp)
+        self.db.backup(backup)
+
+        # Urls taken off the queue but not finished yet
+        with backup:
+            backup.executemany(
+                "INSERT INTO queue (url, depth) VALUES (?, ?)",
+                pending + list(self.popped),
+            )
+        backup.close()
+        os.replace(tmp, dest)
+
+    def restore(self, src: str):
+        self.db.close()
+        shutil.copyfile(src, self.path)
+        self.db = self.connect()
+
+        self.popped.clear()
+        self.queued = self.db.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+        self.visited = self.db.execute("SELECT COUNT(*) FROM visited").fetchone()[0]
+
+        if self.bloom is not None:
+            self.bloom = BloomFilter(max(self.bloom_capacity, self.visited))
+            for (key,) in self.db.execute("SELECT hash FROM visited"):
+                self.bloom.add(key)
+
+    def __len__(self) -> int:
+        return self.queued
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def make_frontier(profile: ProfileConfig, crawlopts: CrawlConfig):
+    if profile.frontier == "disk":
+        logger.info("[%s] Using the disk frontier", profile.profile_name)
+        return DiskFrontier(profile, crawlopts)
+    elif profile.frontier == "memory":
+        return MemoryFrontier(profile, crawlopts)
+    raise ValueError(f"Unknown frontier: {profile.frontier}")
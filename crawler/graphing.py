@@ -1,24 +1,77 @@
 from typing import Iterable, Set
-import networkx as nx
-import ujson as json
+import asyncio
 import logging
 import aiofiles
 
+from storage.graph_file import EXTENSIONS, LinkGraph
+from storage.graph_snapshots import SnapshotStore
+
 logger: logging.Logger = logging.getLogger("Graphing")
 
 
 class Graph:
-    def __init__(self) -> None:
-        self.graph = nx.DiGraph()
+    def __init__(self, graph_format: str = "json") -> None:
+        if graph_format not in EXTENSIONS:
+            raise ValueError(f"Unknown graph format: {graph_format}")
+
+        self.graph_format: str = graph_format
+        self.graph: LinkGraph = LinkGraph()
+
+        # One byte per node: set once the page's links are stored
+        self.linked: bytearray = bytearray()
 
     def update_edges(self, url: str, links: Iterable[str], title: str):
-        self.graph.add_node(url, description=title)
-        self.graph.add_edges_from((url, l) for l in links)
+        source: int = self.graph.intern(url)
+        self.graph.titles[source] = title
+
+        # A page crawled again (found closer to a location) keeps its first links
+        if source < len(self.linked) and self.linked[source]:
+            return
+
+        targets: Set[int] = {self.graph.intern(l) for l in links}
+        self.graph.add_edges(source, targets)
+        self.mark_linked(source)
+
+    def mark_linked(self, source: int):
+        if source >= len(self.linked):
+            self.linked.extend(bytes(source + 1 - len(self.linked)))
+        self.linked[source] = 1
+
+    def copy(self) -> "Graph":
+        graph = Graph(self.graph_format)
+        graph.graph = self.graph.copy()
+        graph.linked = bytearray(self.linked)
+        return graph
+
+    @staticmethod
+    def load(src, graph_format: str = "json") -> "Graph":
+        graph = Graph(graph_format)
+        graph.graph = LinkGraph.load(src)
+        for source in set(graph.graph.sources):
+            graph.mark_linked(source)
+        return graph
 
     async def save(self, dest) -> None:
         try:
-            async with aiofiles.open(dest, "w+") as fd:
-                await fd.write(json.dumps(nx.cytoscape_data(self.graph)))
-            logger.info("Saved graph (%d edges)", len(self.graph.edges))
+            if self.graph_format == "binary":
+                async with aiofiles.open(dest, "wb") as fd:
+                    for chunk in self.graph.binary_chunks():
+                        await fd.write(chunk)
+            else:
+                async with aiofiles.open(dest, "w") as fd:
+                    for chunk in self.graph.cytoscape_chunks():
+                        await fd.write(chunk)
+            logger.info("Saved graph (%d edges)", self.graph.n_edges())
         except Exception as err:
             logger.error("Failed to store graph with error %s", err)
+
+    async def save_snapshot(self, graph_dir: str, profile_name: str, timestamp: str, rebase: int):
+        # Delta against the previous crawl (and a new base every `rebase` crawls)
+        try:
+            store = SnapshotStore(graph_dir, profile_name, rebase)
+            await asyncio.get_running_loop().run_in_executor(
+                None, store.add, timestamp, self.graph
+            )
+            logger.info("Saved graph snapshot (%d edges)", self.graph.n_edges())
+        except Exception as err:
+            logger.error("Failed to store graph snapshot with error %s", err)
@@ -0,0 +1,259 @@
+import cProfile
+import logging
+import multiprocessing.util
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from aiohttp import web
+
+logger: logging.Logger = logging.getLogger("Metrics")
+
+# Histogram upper bounds (seconds); Prometheus adds +Inf
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Hosts listed in the exit summary
+SUMMARY_HOSTS = 10
+
+# `profile` stages: the whole event loop (slow, like older versions), parse
+# workers, and the graph and frontier updates done on the loop
+PROFILE_STAGES = ("loop", "parse", "graph", "frontier")
+LOOP_STAGES = ("graph", "frontier")
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation
+        rank: float = q * self.count
+        seen: int = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def lines(self, name: str, labels: str) -> Iterator[str]:
+        cumulative: int = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels}le="+Inf"}} {self.count}'
+
+        labels = labels.rstrip(",")
+        yield f"{name}_sum{{{labels}}} {self.sum}" if labels else f"{name}_sum {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}" if labels else f"{name}_count {self.count}"
+
+
+def label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    # Updated from the event loop only; cheap enough to stay on in production
+    def __init__(self) -> None:
+        self.fetch: Dict[str, Histogram] = {}
+        self.stages: Dict[str, Histogram] = {}
+        self.errors: Counter = Counter()
+        self.bytes_downloaded: int = 0
+        self.in_flight: int = 0
+        self.queues: Dict[str, Callable[[], int]] = {}
+        self.t_start: float = time.perf_counter()
+
+    def observe_fetch(self, host: str, seconds: float, size: int):
+        histogram: Optional[Histogram] = self.fetch.get(host)
+        if histogram is None:
+            histogram = self.fetch[host] = Histogram()
+        histogram.observe(seconds)
+        self.bytes_downloaded += size
+
+    def observe(self, stage: str, seconds: float):
+        histogram: Optional[Histogram] = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t_start)
+
+    def error(self, kind: str):
+        self.errors[kind] += 1
+
+    def add_queue(self, name: str, depth: Callable[[], int]):
+        self.queues[name] = depth
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        lines: List[str] = [
+            "# HELP crawler_fetch_seconds Fetch latency by host",
+            "# TYPE crawler_fetch_seconds histogram",
+        ]
+        for host, histogram in sorted(self.fetch.items()):
+            lines.extend(histogram.lines("crawler_fetch_seconds", f'host="{label(host)}",'))
+
+        lines += [
+            "# HELP crawler_stage_seconds Time spent per crawl stage",
+            "# TYPE crawler_stage_seconds histogram",
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            lines.extend(histogram.lines("crawler_stage_seconds", f'stage="{label(stage)}",'))
+
+        lines += [
+            "# HELP crawler_downloaded_bytes_total Response bytes downloaded",
+            "# TYPE crawler_downloaded_bytes_total counter",
+            f"crawler_downloaded_bytes_total {self.bytes_downloaded}",
+            "# HELP crawler_in_flight_requests Requests waiting on a response",
+            "# TYPE crawler_in_flight_requests gauge",
+            f"crawler_in_flight_requests {self.in_flight}",
+            "# HELP crawler_queue_depth Items waiting in each queue",
+            "# TYPE crawler_queue_depth gauge",
+        ]
+        for name, depth in sorted(self.queues.items()):
+            lines.append(f'crawler_queue_depth{{queue="{label(name)}"}} {depth()}')
+
+        lines += [
+            "# HELP crawler_errors_total Failed pages by error type",
+            "# TYPE crawler_errors_total counter",
+        ]
+        for kind, count in sorted(self.errors.items()):
+            lines.append(f'crawler_errors_total{{type="{label(kind)}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> List[str]:
+        t_taken: float = max(time.perf_counter() - self.t_start, 1e-9)
+        lines: List[str] = [
+            f"Downloaded {self.bytes_downloaded / 1e6:.2f} MB ({self.bytes_downloaded / 1e6 / t_taken:.2f} MB/s)"
+        ]
+
+        for stage, histogram in sorted(self.stages.items()):
+            lines.append(summarize(stage, histogram))
+
+        busiest = sorted(self.fetch.items(), key=lambda item: -item[1].count)
+        for host, histogram in busiest[:SUMMARY_HOSTS]:
+            lines.append(summarize(f"fetch {host}", histogram))
+
+        if self.errors:
+            lines.append(
+                "Errors: " + ", ".join(f"{kind} {count}" for kind, count in self.errors.most_common())
+            )
+        return lines
+
+    def log_summary(self):
+        for line in self.summary():
+            logger.info(line)
+
+    async def serve(self, port: int) -> web.AppRunner:
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, "127.0.0.1", port).start()
+        except OSError:
+            await runner.cleanup()
+            raise
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", port)
+        return runner
+
+
+def summarize(name: str, histogram: Histogram) -> str:
+    mean: float = histogram.sum / max(histogram.count, 1)
+    return (
+        f"{name}: {histogram.count} calls, {histogram.sum:.2f}s total, mean {mean * 1e3:.1f}ms, "
+        f"p50 <= {histogram.quantile(0.5) * 1e3:g}ms, p99 <= {histogram.quantile(0.99) * 1e3:g}ms"
+    )
+
+
+class StageProfiler:
+    # One cProfile per enabled stage, only around synchronous code on the event loop
+    def __init__(self, stages: List[str], parse_pool: str = "process") -> None:
+        for stage in stages:
+            if stage not in PROFILE_STAGES:
+                raise ValueError(f"Unknown profile stage: {stage}")
+
+        # Python 3.12+ allows one active profiler per interpreter, not per thread
+        if "parse" in stages and parse_pool == "thread" and sys.version_info >= (3, 12):
+            raise ValueError('Profiling "parse" needs parse_pool = "process" on Python 3.12+')
+
+        # The whole-loop profile already covers the loop stages
+        self.profiles: Dict[str, cProfile.Profile] = {
+            stage: cProfile.Profile()
+            for stage in stages
+            if stage in LOOP_STAGES and "loop" not in stages
+        }
+
+    @contextmanager
+    def stage(self, name: str):
+        profile: Optional[cProfile.Profile] = self.profiles.get(name)
+        if profile is None:
+            yield
+            return
+
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def dump(self):
+        for stage, profile in self.profiles.items():
+            path: str = f"profile-{stage}.perf"
+            profile.dump_stats(path)
+            logger.info("Saved %s profile to '%s'", stage, path)
+
+
+# Parse workers profile themselves: one profile per worker process and thread
+worker_profiles: Dict[Any, cProfile.Profile] = {}
+dump_registered: Optional[int] = None
+
+
+def dump_worker_profiles():
+    for (pid, thread), profile in worker_profiles.items():
+        if pid == os.getpid():
+            profile.dump_stats(f"profile-parse-{pid}-{thread}.perf")
+
+
+def profiled_batch(batch_fn: Callable[[List[Any]], List[Any]], batch: List[Any]) -> List[Any]:
+    global dump_registered
+
+    key = (os.getpid(), threading.get_ident())
+    profile: Optional[cProfile.Profile] = worker_profiles.get(key)
+    if profile is None:
+        profile = worker_profiles[key] = cProfile.Profile()
+
+    # Written once when the process exits: pool workers run multiprocessing
+    # finalizers on shutdown, the main process (thread pool) at exit
+    if dump_registered != key[0]:
+        dump_registered = key[0]
+        multiprocessing.util.Finalize(None, dump_worker_profiles, exitpriority=10)
+
+    profile.enable()
+    try:
+        return batch_fn(batch)
+    finally:
+        profile.disable()
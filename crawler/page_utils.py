@@ -1,38 +1,79 @@
 import logging
-import os
 from urllib.parse import urldefrag, urljoin, urlparse
-from typing import Optional, List, Set, Tuple
-import aiofiles
+from typing import Dict, NamedTuple, Optional, List, Set, Tuple, Union
 import aiohttp
 from lxml import html
 import zlib
 import hashlib
 
 import unidecode
+from sqlalchemy import Row
 
 from models import CrawlConfig, ProfileConfig
+from cache_writer import CacheWriter
+from parse_pool import ParsePool
 
 logger = logging.getLogger("PageUtils")
 
 
+class PageResult(NamedTuple):
+    links: Tuple[str, ...]
+    title: str
+    hash: str
+    compressed: bytes
+    unchanged: bool = False
+
+
+class Response(NamedTuple):
+    status: int
+    content: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int = 0
+
+
 class Page:
     @staticmethod
-    def links(src: str, document: str) -> Set[str]:
+    def extract(src: str, document: str, previous_hash: Optional[str] = None) -> PageResult:
+        compressed_data: bytes = Page.compress(document)
+        hash_str: str = Page.hash(compressed_data)
+
+        # Same content as the last crawl: nothing to parse or cache
+        if hash_str == previous_hash:
+            return PageResult((), "", hash_str, b"", unchanged=True)
+
+        # Single parse for links and title
+        root = html.fromstring(document)
+
         links: Set[str] = set()
-        for tag in html.fromstring(document).xpath("//a"):
+        for tag in root.xpath("//a"):
             href: Optional[str] = tag.get("href")
             if not href:
                 continue
             link, _ = urldefrag(urljoin(src, href))
             links.add(link)
-        return links
+
+        title = root.xpath("//title/text()")
+
+        return PageResult(
+            links=tuple(links),
+            title=unidecode.unidecode(title[0]) if title else "",
+            hash=hash_str,
+            compressed=compressed_data,
+        )
 
     @staticmethod
-    def title(document: str) -> str:
-        title = html.fromstring(document).xpath("//title/text()")
-        if title:
-            return unidecode.unidecode(title[0])
-        return ""
+    def parse_batch(
+        batch: List[Tuple[str, str, Optional[str]]]
+    ) -> List[Union[PageResult, Exception]]:
+        # Runs in the parse pool
+        results: List[Union[PageResult, Exception]] = []
+        for src, document, previous_hash in batch:
+            try:
+                results.append(Page.extract(src, document, previous_hash))
+            except Exception as err:
+                results.append(err)
+        return results
 
     @staticmethod
     def compress(content: str) -> bytes:
@@ -43,37 +84,63 @@ class Page:
         return hashlib.sha1(content).hexdigest()
 
     @staticmethod
-    async def get(websesion: aiohttp.ClientSession, url: str):
-        async with websesion.get(url) as response:
-            return await response.text()
+    async def get(
+        websesion: aiohttp.ClientSession, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Response:
+        async with websesion.get(url, headers=headers) as response:
+            # text() decodes the body read here
+            body: bytes = await response.read()
+            return Response(
+                status=response.status,
+                content=await response.text(),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                size=len(body),
+            )
 
     @staticmethod
-    async def cache(dest, data):
-        if os.path.exists(dest):
-            return
+    def conditional_headers(previous: Optional[Row]) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if previous is None or previous.links is None:
+            return headers
 
-        async with aiofiles.open(dest, "wb+") as fd:
-            await fd.write(data)
+        if previous.etag:
+            headers["If-None-Match"] = previous.etag
+        if previous.last_modified:
+            headers["If-Modified-Since"] = previous.last_modified
+        return headers
+
+    @staticmethod
+    def stored_links(previous: Row) -> Set[str]:
+        return set(previous.links.split("\n")) if previous.links else set()
 
     @staticmethod
     async def parse(
         src: str,
         content: str,
-        cache_dir: str,
+        pool: ParsePool,
+        cache: CacheWriter,
         profile: ProfileConfig,
+        previous: Optional[Row] = None,
     ) -> Tuple[Set[str], str, str]:
         # content: str = await Page.get(websession, src)
-        links: Set[str] = Page.links(src, content)
+        previous_hash: Optional[str] = None
+        if previous is not None and previous.links is not None:
+            previous_hash = previous.hash
 
-        compressed_data: bytes = Page.compress(content)
-        hash_str = Page.hash(compressed_data)
+        result: PageResult = await pool.parse(src, content, previous_hash)
 
-        profile.tasks.append(
-            Page.cache(os.path.join(cache_dir, hash_str), compressed_data)
-        )
+        if result.unchanged:
+            links: Set[str] = Page.stored_links(previous)
+            title: str = previous.title
+        else:
+            # Blocks when the cache writers fall behind
+            await cache.put(result.hash, result.compressed, profile.profile_name)
+            links = set(result.links)
+            title = result.title
 
         Page.filter(links, profile)
-        return links, hash_str, Page.title(content)
+        return links, result.hash, title
 
     @staticmethod
     def filter(links: Set[str], profile: ProfileConfig):
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Optional, Tuple
+
+from models import CrawlConfig
+from metrics import Metrics
+
+logger: logging.Logger = logging.getLogger("ParsePool")
+
+
+class ParsePool:
+    def __init__(
+        self,
+        crawlopts: CrawlConfig,
+        batch_fn: Callable[[List[Tuple[str, str, Optional[str]]]], List[Any]],
+        metrics: Metrics,
+    ) -> None:
+        self.crawlopts: CrawlConfig = crawlopts
+        self.batch_fn = batch_fn
+        self.metrics: Metrics = metrics
+
+        workers: int = crawlopts.parse_workers or os.cpu_count() or 1
+        if crawlopts.parse_pool == "thread":
+            self.executor: Executor = ThreadPoolExecutor(workers)
+        elif crawlopts.parse_pool == "process":
+            self.executor = ProcessPoolExecutor(workers)
+        else:
+            raise ValueError(f"Unknown parse_pool: {crawlopts.parse_pool}")
+
+        logger.info("Parsing with %d %s workers", workers, crawlopts.parse_pool)
+
+        # Pages waiting for the next batch
+        self.pending: List[Tuple[str, str, Optional[str], asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def parse(self, url: str, content: str, previous_hash: Optional[str] = None) -> Any:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        self.pending.append((url, content, previous_hash, future))
+
+        if len(self.pending) >= self.crawlopts.parse_batch:
+            self.flush()
+        elif self.flush_handle is None:
+            # Don't hold a partial batch for long
+            self.flush_handle = loop.call_later(0.005, self.flush)
+
+        # Includes batching and waiting for a free worker
+        with self.metrics.timer("parse"):
+            return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        task = asyncio.get_running_loop().run_in_executor(
+            self.executor, self.batch_fn, [item[:3] for item in batch]
+        )
+        task.add_done_callback(partial(self.resolve, batch))
+
+    @staticmethod
+    def resolve(batch: List[Tuple[str, str, Optional[str], asyncio.Future]], task: asyncio.Future):
+        if task.exception() is not None:
+            results = [task.exception()] * len(batch)
+        else:
+            results = task.result()
+
+        for (_, _, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
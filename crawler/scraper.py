@@ -3,15 +3,23 @@ import aiohttp
 import logging
 import os
 import sys
-from typing import Coroutine, List, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+import time
 import traceback
-from sqlalchemy.ext.asyncio import AsyncSession
-import itertools
+from sqlalchemy import Row
 
 sys.path.extend([os.getcwd()])
 from models import *
 from page_utils import *
 from graphing import Graph
+from storage.graph_file import EXTENSIONS
+from cache_writer import CacheWriter
+from parse_pool import ParsePool
+from db_writer import BulkWriter
+from frontier import make_frontier
+from checkpoint import Checkpoint
+from metrics import Metrics, StageProfiler
 
 logger: logging.Logger = logging.getLogger("Scraper")
 
@@ -21,7 +29,13 @@ class Scraper:
         self,
         profile: ProfileConfig,
         crawlopts: CrawlConfig,
-        session: AsyncSession,
+        db: BulkWriter,
+        limiter: asyncio.Semaphore,
+        pool: ParsePool,
+        cache: CacheWriter,
+        checkpoint: Checkpoint,
+        metrics: Metrics,
+        profiler: StageProfiler,
     ) -> None:
         # Logging
         self.crawlopts = crawlopts
@@ -35,78 +49,248 @@ class Scraper:
         self.profile: ProfileConfig = profile
 
         # Graphing
-        self.graph: Graph = Graph()
-        self.tasks: List[Coroutine] = []
+        self.graph: Graph = Graph(crawlopts.graph_format)
 
-        # URL Queues (sets)
-        self.queue: Set[str] = set(self.profile.locations)
-        self.new_queue: Set[str] = set()
-        self.visited_urls: Set[str] = set()
+        # URL frontier (url, depth)
+        self.frontier = make_frontier(self.profile, self.crawlopts)
+        self.crawled: int = 0
+        self.unchanged: int = 0
+        self.depth_reached: int = 0
 
-        # Database (SQLAlchemy)
-        self.session: AsyncSession = session
+        # Checkpoints
+        self.checkpoint: Checkpoint = checkpoint
+        self.generation: int = 0
 
-    async def crawl_worker(self, url: str, content: str):
-        self.visited_urls.add(url)
+        state: Optional[Dict[str, Any]] = checkpoint.state(profile.profile_name)
+        if state is not None:
+            self.restore(state)
+        else:
+            for url in self.profile.locations:
+                self.frontier.push(url, 0)
+
+        # Scheduling (limiter is shared between all scrapers)
+        self.limiter: asyncio.Semaphore = limiter
+        # (url, depth) in flight; a url found again closer to a location can be in twice
+        self.active: Set[Tuple[str, int]] = set()
+        self.wakeup: asyncio.Condition = asyncio.Condition()
+
+        # Parsing
+        self.pool: ParsePool = pool
+
+        # Page cache
+        self.cache: CacheWriter = cache
+
+        # Database (batched inserts)
+        self.db: BulkWriter = db
+
+        # Metrics and per-stage profiles (shared between all scrapers)
+        self.metrics: Metrics = metrics
+        self.profiler: StageProfiler = profiler
+        metrics.add_queue(f"frontier/{profile.profile_name}", self.frontier.__len__)
+
+    async def crawl_worker(
+        self, websession: aiohttp.ClientSession, url: str
+    ) -> Set[str]:
+        self.crawled += 1
 
         # TODO: Find a better alternative
         try:
-            # Parse
-            links, hash_str, title = await Page.parse(
-                url, content, self.crawlopts.cache_dir, self.profile
+            # Last crawl of this page (incremental mode)
+            previous: Optional[Row] = None
+            if self.crawlopts.incremental:
+                previous = await self.db.previous(url)
+
+            # Fetch
+            async with self.limiter:
+                self.metrics.in_flight += 1
+                t_start = time.perf_counter()
+                try:
+                    response: Response = await Page.get(
+                        websession, url, Page.conditional_headers(previous)
+                    )
+                finally:
+                    self.metrics.in_flight -= 1
+
+            self.metrics.observe_fetch(
+                urlsplit(url).netloc, time.perf_counter() - t_start, response.size
             )
+            if response.status >= 400:
+                self.metrics.error(f"http_{response.status}")
 
-            # Add page data to database
-            self.session.add(
-                URLData(
-                    url=url,
-                    profile_name=self.profile.profile_name,
-                    time=self.crawlopts.unix_time,
-                    hash=hash_str,
-                    title=title,
+            if response.status == 304 and previous is not None:
+                # Not modified: reuse the stored page
+                self.unchanged += 1
+                links: Set[str] = Page.stored_links(previous)
+                Page.filter(links, self.profile)
+                hash_str, title = previous.hash, previous.title
+            else:
+                # Parse
+                links, hash_str, title = await Page.parse(
+                    url, response.content, self.pool, self.cache, self.profile, previous
                 )
+                if previous is not None and hash_str == previous.hash:
+                    self.unchanged += 1
+
+            # Add page data to database
+            await self.db.add(
+                url=url,
+                profile_name=self.profile.profile_name,
+                time=self.crawlopts.unix_time,
+                hash=hash_str,
+                title=title,
+                etag=response.etag,
+                last_modified=response.last_modified,
+                links="\n".join(sorted(links)) if self.crawlopts.incremental else None,
             )
 
-            self.graph.update_edges(url, links, title)
-            self.new_queue.update(links)
+            with self.profiler.stage("graph"):
+                self.graph.update_edges(url, links, title)
+            return links
         except Exception as err:
+            self.metrics.error(type(err).__name__)
             logger.error("Error (%s) crawling url %s", err, url)
             logger.error(traceback.format_exc())
             self.graph.update_edges(url, [f"ERROR {err}"], "<error-title>")
+            return set()
 
-    async def crawl(self):
-        websession = aiohttp.ClientSession()
+    async def next_url(self) -> Optional[Tuple[str, int]]:
+        async with self.wakeup:
+            while True:
+                item = self.frontier.pop()
+                if item is not None:
+                    url, depth = item
+                    self.active.add(item)
+                    self.depth_reached = max(self.depth_reached, depth)
+                    return item
 
-        # Start crawling
-        for _ in range(self.profile.depth):
-            contents: List[str] = await asyncio.gather(*[
-                Page.get(websession, url)
-                for url in self.queue
-            ])
+                # Nothing queued and nothing in flight: the crawl is done
+                if not self.active:
+                    return None
+                await self.wakeup.wait()
 
-            self.tasks.extend(
-                self.crawl_worker(url, content)
-                for (url, content) in zip(self.queue, contents)
-            )
+    async def task_done(self, url: str, links: Set[str], depth: int):
+        async with self.wakeup:
+            self.active.discard((url, depth))
 
-            await asyncio.gather(*self.tasks)
-            self.tasks.clear()
+            if depth + 1 < self.profile.depth:
+                with self.profiler.stage("frontier"):
+                    for link in links:
+                        self.frontier.push(link, depth + 1)
 
-            self.queue = self.new_queue - self.visited_urls
-            self.new_queue.clear()
+            self.wakeup.notify_all()
+
+    async def fetch_worker(self, websession: aiohttp.ClientSession):
+        while True:
+            item = await self.next_url()
+            if item is None:
+                return
+
+            url, depth = item
+            links: Set[str] = set()
+            try:
+                links = await self.crawl_worker(websession, url)
+            finally:
+                await self.task_done(url, links, depth)
+
+    def restore(self, state: Dict[str, Any]):
+        self.generation = state["generation"]
+        self.crawled = state["crawled"]
+        self.depth_reached = state["depth"]
+
+        name: str = self.profile.profile_name
+        self.frontier.restore(self.checkpoint.path(name, self.generation, "frontier"))
+        graph_path: str = self.checkpoint.path(name, self.generation, "graph")
+        if os.path.exists(graph_path):
+            self.graph = Graph.load(graph_path, self.crawlopts.graph_format)
 
         logger.info(
-            "[%s] Crawled: %d URLs", self.profile.profile_name, len(self.visited_urls)
+            "[%s] Resumed at depth %d: %d crawled, %d queued",
+            name,
+            self.depth_reached,
+            self.crawled,
+            len(self.frontier),
         )
-        logger.info("[%s] queue size: %d", self.profile.profile_name, len(self.queue))
 
-        # Store graph
-        await self.graph.save(
-            os.path.join(
-                self.crawlopts.graph_ts_dir,
-                f"{self.profile.profile_name}.json"
+    def state(self, finished: bool = False) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "crawled": self.crawled,
+            "depth": self.depth_reached,
+            "finished": finished,
+        }
+
+    async def save_checkpoint(self):
+        name: str = self.profile.profile_name
+        generation: int = self.generation + 1
+
+        # Workers block on the frontier only while the state is copied
+        async with self.wakeup:
+            self.frontier.save(
+                self.checkpoint.path(name, generation, "frontier"),
+                list(self.active),  # re-fetched on resume
             )
+            graph: Graph = self.graph.copy()
+            cache_writes: List[asyncio.Future] = self.cache.pending_writes(name)
+            state: Dict[str, Any] = self.state()
+
+        # Pages finished before the copy are stored before the checkpoint is published
+        await self.db.flush()
+        await asyncio.gather(*cache_writes)
+        await graph.save(self.checkpoint.path(name, generation, "graph"))
+
+        self.generation = state["generation"] = generation
+        self.checkpoint.update(name, state)
+
+        logger.info("[%s] Checkpoint %d saved", name, generation)
+
+    async def checkpointer(self):
+        while True:
+            await asyncio.sleep(self.crawlopts.checkpoint_interval)
+            try:
+                await self.save_checkpoint()
+            except Exception as err:
+                logger.error("[%s] Checkpoint failed with %s", self.profile.profile_name, err)
+
+    async def crawl(self):
+        websession = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.crawlopts.concurrency)
         )
+        checkpointer = asyncio.create_task(self.checkpointer())
+
+        # Start crawling
+        if self.profile.depth > 0:
+            await asyncio.gather(*[
+                self.fetch_worker(websession)
+                for _ in range(self.crawlopts.concurrency)
+            ])
+
+        checkpointer.cancel()
+        await asyncio.gather(checkpointer, return_exceptions=True)
+
+        logger.info("[%s] Crawled: %d URLs", self.profile.profile_name, self.crawled)
+        if self.crawlopts.incremental:
+            logger.info("[%s] Unchanged: %d URLs", self.profile.profile_name, self.unchanged)
+        logger.info("[%s] queue size: %d", self.profile.profile_name, len(self.frontier))
+
+        # Store graph
+        if self.crawlopts.graph_snapshots:
+            await self.graph.save_snapshot(
+                self.crawlopts.graph_dir,
+                self.profile.profile_name,
+                self.crawlopts.timestamp,
+                self.crawlopts.graph_rebase,
+            )
+        else:
+            await self.graph.save(
+                os.path.join(
+                    self.crawlopts.graph_ts_dir,
+                    self.profile.profile_name + EXTENSIONS[self.crawlopts.graph_format],
+                )
+            )
+
+        # Nothing left to resume for this profile
+        self.checkpoint.update(self.profile.profile_name, self.state(finished=True))
+        self.frontier.close()
 
         # Cleanup Web session
         await websession.close()
@@ -1,12 +1,18 @@
 import asyncio
 import logging
 import os
-from typing import Dict, List
+from typing import Coroutine, Dict, List
 
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from scraper import Scraper
+from cache_writer import CacheWriter
+from db_writer import BulkWriter
+from checkpoint import Checkpoint
+from page_utils import Page
+from parse_pool import ParsePool
+from metrics import Metrics, StageProfiler, profiled_batch
+from functools import partial
 import sys
 
 sys.path.extend(os.getcwd())
@@ -17,7 +23,10 @@ logger: logging.Logger = logging.getLogger("CrawlWorker")
 
 class Crawler:
     def __init__(
-        self, crawlopts: CrawlConfig, profileopts: List[ProfileConfig]
+        self,
+        crawlopts: CrawlConfig,
+        profileopts: List[ProfileConfig],
+        resume: bool = False,
     ) -> None:
         self.profiles: List[ProfileConfig] = profileopts
         self.crawl_workers: List[Coroutine] = []
@@ -30,31 +39,60 @@ class Crawler:
 
         logger.info("Checking profiles [%d profile(s)]", len(profileopts))
 
+        # Checkpoints (resume picks up the interrupted crawl's timestamps)
+        self.checkpoint: Checkpoint = Checkpoint(self.crawlopts)
+        if resume:
+            self.checkpoint.load()
+        else:
+            self.checkpoint.start()
+
         # SQLAlchemy (engines)
         self.engines: Dict[str, AsyncEngine] = {}
-        self.session_makers: Dict[str, sessionmaker] = {}
-        self.sessions: List[AsyncSession] = []
+        self.db_writers: List[BulkWriter] = []
+
+        # Parsing and page cache (started in `run`)
+        self.pool: ParsePool
+        self.cache: CacheWriter
+
+        # Per-stage metrics and profiles
+        self.metrics: Metrics = Metrics()
+        self.profiler: StageProfiler = StageProfiler(
+            self.crawlopts.profile, self.crawlopts.parse_pool
+        )
 
         # Profiles
         for profile in profileopts:
+            # Concatenated: os.path.join would drop the scheme for an absolute path
             engine: AsyncEngine = create_async_engine(
-                os.path.join(
-                    "sqlite+aiosqlite:///",
-                    os.path.join(
-                        self.crawlopts.database_dir, f"{profile.profile_name}.db"
-                    ),
-                ),
+                "sqlite+aiosqlite:///"
+                + os.path.join(self.crawlopts.database_dir, f"{profile.profile_name}.db"),
                 echo=self.crawlopts.debug,
             )
             self.engines[profile.profile_name] = engine
-            self.session_makers[profile.profile_name] = sessionmaker(
-                bind=engine, class_=AsyncSession
-            )
 
     async def run(self):
         # Setup database
         await self.setup_database()
 
+        # Start parse pool and cache writers
+        batch_fn = Page.parse_batch
+        if "parse" in self.crawlopts.profile:
+            batch_fn = partial(profiled_batch, Page.parse_batch)
+        self.pool = ParsePool(self.crawlopts, batch_fn, self.metrics)
+        self.cache = CacheWriter(self.crawlopts, self.metrics)
+        self.cache.start()
+
+        metrics_server = None
+        if self.crawlopts.metrics_port:
+            try:
+                metrics_server = await self.metrics.serve(self.crawlopts.metrics_port)
+            except OSError as err:
+                logger.error(
+                    "Metrics endpoint unavailable on port %d (%s), crawling without it",
+                    self.crawlopts.metrics_port,
+                    err,
+                )
+
         logger.info("Starting crawling at: %s", time.asctime())
         t_start = time.perf_counter_ns()
 
@@ -73,38 +111,55 @@ class Crawler:
         # Save entries to database
         await self.finish()
 
+        self.metrics.log_summary()
+        self.profiler.dump()
+        if metrics_server is not None:
+            await metrics_server.cleanup()
+
     async def crawl(self):
+        # Global limit on concurrent requests (all profiles)
+        limiter = asyncio.Semaphore(self.crawlopts.concurrency)
+
         for it, profile in enumerate(self.profiles, start=1):
-            # Get database session
-            session = self.session_makers[profile.profile_name]()
+            state = self.checkpoint.state(profile.profile_name)
+            if state is not None and state["finished"]:
+                logger.info("%d> %s (finished before resume)", it, profile.profile_name)
+                continue
+
+            # Get database writer
+            db = BulkWriter(self.engines[profile.profile_name], self.crawlopts, self.metrics)
+            db.start()
 
             # Schedule scraper
             logger.info("%d> %s", it, profile.profile_name)
-            scraper = Scraper(profile, self.crawlopts, session)
+            scraper = Scraper(
+                profile,
+                self.crawlopts,
+                db,
+                limiter,
+                self.pool,
+                self.cache,
+                self.checkpoint,
+                self.metrics,
+                self.profiler,
+            )
 
-            # Append session
+            # Append writer
             self.crawl_workers.append(scraper.crawl())
-            self.sessions.append(session)
+            self.db_writers.append(db)
 
     async def save_all_files(self):
-        # Save all pending files
-        for profile in self.profiles:
-            await asyncio.gather(*profile.tasks)
-            logger.info(
-                "%s> Saved %d files to disk",
-                profile.profile_name,
-                len(profile.tasks),
-            )
+        # Flush pending cache writes
+        await self.cache.close()
 
-    async def commit_sessions(self):
-        logger.info("Committing sessions")
+    async def flush_databases(self):
+        logger.info("Flushing database writers")
 
-        # Commit all sessions
-        await asyncio.gather(*[session.commit() for session in self.sessions])
+        # Flush remaining rows
+        await asyncio.gather(*[db.close() for db in self.db_writers])
 
-        # Close all sessions
-        for session_maker in self.session_makers.values():
-            session_maker.close_all()
+        # Close all engines
+        await asyncio.gather(*[engine.dispose() for engine in self.engines.values()])
 
     async def setup_database(self):
         logging.info("Setting up databases ...")
@@ -118,7 +173,11 @@ class Crawler:
                 await conn.exec_driver_sql("PRAGMA cache_size = 100000000;")
                 await conn.exec_driver_sql("PRAGMA foreign_keys = true;")
                 await conn.exec_driver_sql("PRAGMA temp_store = memory;")
-                await conn.run_sync(Base.metadata.create_all)
+                await conn.run_sync(upgrade_schema)
 
     async def finish(self):
-        await asyncio.gather(self.commit_sessions(), self.save_all_files())
+        self.pool.close()
+        await asyncio.gather(self.flush_databases(), self.save_all_files())
+
+        # Crawl completed
+        self.checkpoint.clear()
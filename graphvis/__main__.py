@@ -2,11 +2,18 @@ import sys
 import argparse
 import os
 import datetime
+import tempfile
 import sortedcontainers
-from app import create_app
 
-sys.path.extend(os.getcwd())
+sys.path.extend([os.getcwd()])
+from app import create_app
+from graph_index import LAYOUT_SUFFIX
 from models import *
+from storage.graph_file import LinkGraph
+from storage.graph_snapshots import SnapshotStore, crawl_graphs, diff_graphs, graph_timestamps, load_graph
+
+# Examples printed per change type by -diff
+DIFF_EXAMPLES = 5
 
 
 def timestamp_to_unix(timestamp: str) -> float:
@@ -14,25 +21,85 @@ def timestamp_to_unix(timestamp: str) -> float:
 
 
 def list_graphs(root):
-    folders = os.listdir(root)
+    # Graph files and stored snapshots, grouped by crawl
+    crawls = crawl_graphs(root)
     order = sortedcontainers.SortedDict()
 
-    for folder in folders:
-        order[timestamp_to_unix(folder)] = folder
+    for timestamp, graphs in crawls.items():
+        if graphs:
+            order[timestamp_to_unix(timestamp)] = timestamp
+
+    print("Snapshots (show with -show PATH or -show TIMESTAMP/PROFILE): ")
+    for i, timestamp in enumerate(reversed(order.values()), start=1):
+        graphs = crawls[timestamp]
+
+        print(f"[{i}] {timestamp} {len(graphs)} profiles")
+        for graph in graphs:
+            print(f"\t {graph}")
+
+
+def resolve(root, target, workdir):
+    # A graph file, or TIMESTAMP/PROFILE from the snapshot store; returns the
+    # graph path and where its layout is cached (None: next to the graph)
+    if os.path.isfile(target):
+        return target, None
+
+    timestamp, _, profile = target.partition("/")
+    if not timestamp or not profile:
+        sys.exit(f"{target} is neither a graph file nor TIMESTAMP/PROFILE")
+
+    store = SnapshotStore(root, profile)
+    if timestamp not in store.timestamps():
+        sys.exit(f"No snapshot of {profile} at {timestamp} (see -list)")
+
+    # Laid out like a crawl's graph folder, which the viewer's title is read from
+    path = os.path.join(workdir, timestamp, f"{profile}.graph")
+    os.makedirs(os.path.dirname(path))
+    graph: LinkGraph = store.load(timestamp)
+    with open(path, "wb") as fd:
+        for chunk in graph.binary_chunks():
+            fd.write(chunk)
+    return path, os.path.join(store.root, timestamp + LAYOUT_SUFFIX)
+
 
-    print("Snapshots: ")
-    for i, (entry, profile_name) in enumerate(reversed(order.items()), start=1):
-        profile_root = os.path.join(root, profile_name)
-        profiles = os.listdir(profile_root)
+def show(root, target, debug=False):
+    # Snapshots are rebuilt into a temporary directory, removed when the viewer stops
+    with tempfile.TemporaryDirectory(prefix="graphvis-") as workdir:
+        path, layout_path = resolve(root, target, workdir)
+        create_app(os.path.abspath(path), debug, layout_path)
 
-        print(f"[{i}] {order[entry]} {len(profiles)} profiles")
-        for profile in profiles:
-            print(f"\t {os.path.join(profile_root, profile)}")
 
+def print_examples(label, items):
+    print(f"\t{label}: {len(items)}")
+    for item in sorted(items)[:DIFF_EXAMPLES]:
+        print("\t\t" + (" -> ".join(item) if isinstance(item, tuple) else item))
 
-def show(path, debug=False):
-    path = os.path.abspath(path)
-    create_app(path, debug)
+
+def diff(root, a, b):
+    profiles = set()
+    if os.path.isdir(os.path.join(root, "snapshots")):
+        profiles.update(os.listdir(os.path.join(root, "snapshots")))
+    for timestamp in (a, b):
+        if os.path.isdir(os.path.join(root, timestamp)):
+            profiles.update(os.path.splitext(name)[0] for name in os.listdir(os.path.join(root, timestamp)))
+
+    for profile in sorted(profiles):
+        timestamps = graph_timestamps(root, profile)
+        if a not in timestamps or b not in timestamps:
+            continue
+
+        # Stored deltas when both crawls are in the chain, full graphs otherwise
+        store = SnapshotStore(root, profile)
+        if a in store.timestamps() and b in store.timestamps():
+            changes = store.diff(a, b)
+        else:
+            changes = diff_graphs(load_graph(root, profile, a), load_graph(root, profile, b))
+
+        print(f"{profile}: {a} -> {b}")
+        print_examples("Added pages", changes.added_pages)
+        print_examples("Removed pages", changes.removed_pages)
+        print_examples("Added links", changes.added_links)
+        print_examples("Removed links", changes.removed_links)
 
 
 def main(args):
@@ -42,8 +109,12 @@ def main(args):
         list_graphs(crawlopts.graph_dir)
         return
 
+    if args.diff:
+        diff(crawlopts.graph_dir, *args.diff)
+        return
+
     if args.show:
-        show(args.show, crawlopts.debug)
+        show(crawlopts.graph_dir, args.show, crawlopts.debug)
 
 
 if __name__ == "__main__":
@@ -52,7 +123,16 @@ if __name__ == "__main__":
     parser.add_argument(
         "-list", help="List all graphs", required=False, action="store_true"
     )
-    parser.add_argument("-show", help="View the specified graph", required=False)
+    parser.add_argument(
+        "-show", help="View the specified graph file or TIMESTAMP/PROFILE snapshot", required=False
+    )
+    parser.add_argument(
+        "-diff",
+        help="Pages and links added or removed between two crawl timestamps",
+        nargs=2,
+        metavar=("A", "B"),
+        required=False,
+    )
 
     args = parser.parse_args()
     main(args)
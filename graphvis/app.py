@@ -1,27 +1,92 @@
-from flask import Flask, render_template, send_file
+from flask import Flask, Response, jsonify, render_template, request, send_file
 from flask_bootstrap import Bootstrap5
 from waitress import serve
 from flask_minify import Minify
 import ujson as json
+import gzip
 import tempfile
 import os
 
+from storage.graph_file import MAGIC, LinkGraph
+from graph_index import GraphIndex
 
-def create_app(graph_path, debug=False):
+MAX_NODES = 2000
+DEFAULT_NODES = 300
+GZIP_MIN_SIZE = 1024
+
+
+def create_app(graph_path, debug=False, layout_path=None):
     app = Flask(__name__)
     Bootstrap5(app)
 
+    # Loaded once; every subgraph request is served from memory
+    index = GraphIndex(graph_path, layout_path)
+
+    def node_limit() -> int:
+        return min(max(request.args.get("limit", DEFAULT_NODES, type=int), 1), MAX_NODES)
+
+    @app.after_request
+    def compress(response: Response) -> Response:
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code != 200
+            or "gzip" not in request.headers.get("Accept-Encoding", "")
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+
+        data: bytes = response.get_data()
+        if len(data) < GZIP_MIN_SIZE:
+            return response
+
+        response.set_data(gzip.compress(data, compresslevel=5))
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
     @app.route("/graph")
     def serve_graph():
+        with open(graph_path, "rb") as fd:
+            binary: bool = fd.read(len(MAGIC)) == MAGIC
+
+        # Binary edge lists are converted to cytoscape json on the fly
+        if binary:
+            return Response(LinkGraph.load(graph_path).cytoscape_chunks(), mimetype="application/json")
         return send_file(graph_path, mimetype="application/json")
 
+    @app.route("/subgraph/top")
+    def top():
+        offset = max(request.args.get("offset", 0, type=int), 0)
+        return jsonify(index.elements(index.top(node_limit(), offset)))
+
+    @app.route("/subgraph/neighborhood")
+    def neighborhood():
+        node = index.node(request.args.get("url", ""))
+        if node is None:
+            return jsonify({"error": "Unknown url"}), 404
+
+        hops = min(max(request.args.get("hops", 1, type=int), 1), 5)
+        return jsonify(index.elements(index.neighborhood(node, hops, node_limit())))
+
+    @app.route("/subgraph/prefix")
+    def prefix():
+        offset = max(request.args.get("offset", 0, type=int), 0)
+        nodes, total = index.prefix(request.args.get("prefix", ""), node_limit(), offset)
+
+        elements = index.elements(nodes)
+        elements["total"] = total
+        return jsonify(elements)
+
     @app.route("/")
     def main():
         return render_template(
             "graph.html",
             context={
-                "profile": os.path.basename(graph_path).strip(".json"),
+                "profile": os.path.splitext(os.path.basename(graph_path))[0],
                 "timestamp": os.path.basename(os.path.dirname(graph_path)),
+                "nodes": index.graph.n_nodes(),
+                "edges": index.graph.n_edges(),
             },
         )
 
@@ -0,0 +1,173 @@
+import logging
+import math
+import os
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import deque
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from storage.graph_file import LinkGraph
+
+logger: logging.Logger = logging.getLogger("GraphIndex")
+
+# Cached layout: f32 x then f32 y per node, next to the graph file (snapshots
+# are rebuilt into a temporary file, so theirs is kept in the snapshot store)
+LAYOUT_SUFFIX = ".layout"
+LAYOUT_RADIUS = 5000.0
+
+
+def adjacency(n: int, keys: array, values: array) -> Tuple[array, array]:
+    # CSR: neighbours of node i are items[offsets[i]:offsets[i + 1]]
+    counts: List[int] = [0] * n
+    for key in keys:
+        counts[key] += 1
+    offsets: array = array("Q", [0])
+    offsets.extend(accumulate(counts))
+
+    fill: List[int] = list(offsets[:-1])
+    items: array = array("I", bytes(4 * len(keys)))
+    for key, value in zip(keys, values):
+        items[fill[key]] = value
+        fill[key] += 1
+    return offsets, items
+
+
+class GraphIndex:
+    # Loaded once per server: adjacency both ways, degrees, sorted urls and a layout
+    def __init__(self, path: str, layout_path: Optional[str] = None) -> None:
+        self.path: str = path
+        self.layout_path: Optional[str] = layout_path
+        self.graph: LinkGraph = LinkGraph.load(path)
+        n: int = self.graph.n_nodes()
+
+        self.out_offsets, self.out_edges = adjacency(n, self.graph.sources, self.graph.targets)
+        self.in_offsets, self.in_edges = adjacency(n, self.graph.targets, self.graph.sources)
+        self.degrees: List[int] = [
+            self.out_offsets[i + 1] - self.out_offsets[i] + self.in_offsets[i + 1] - self.in_offsets[i]
+            for i in range(n)
+        ]
+
+        # Highest degree first, then by url for a stable order
+        self.by_degree: List[int] = sorted(
+            range(n), key=lambda node: (-self.degrees[node], self.graph.urls[node])
+        )
+        self.by_url: List[Tuple[str, int]] = sorted(
+            (url, node) for node, url in enumerate(self.graph.urls)
+        )
+        self.x, self.y = self.layout()
+
+        logger.info("Indexed %s: %d nodes, %d edges", path, n, self.graph.n_edges())
+
+    def node(self, url: str) -> Optional[int]:
+        return self.graph.ids.get(url)
+
+    def neighbours(self, node: int) -> Iterable[int]:
+        yield from self.out_edges[self.out_offsets[node] : self.out_offsets[node + 1]]
+        yield from self.in_edges[self.in_offsets[node] : self.in_offsets[node + 1]]
+
+    def neighborhood(self, node: int, hops: int, limit: int) -> List[int]:
+        # Breadth first over links in both directions, closest nodes first
+        seen: Set[int] = {node}
+        order: List[int] = [node]
+        queue = deque([(node, 0)])
+        while queue and len(order) < limit:
+            current, distance = queue.popleft()
+            if distance == hops:
+                continue
+            for neighbour in self.neighbours(current):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    order.append(neighbour)
+                    queue.append((neighbour, distance + 1))
+                    if len(order) >= limit:
+                        break
+        return order
+
+    def top(self, limit: int, offset: int = 0) -> List[int]:
+        return self.by_degree[offset : offset + limit]
+
+    def prefix(self, prefix: str, limit: int, offset: int = 0) -> Tuple[List[int], int]:
+        # Nodes whose url starts with prefix (page of them, plus the total count)
+        start: int = bisect_left(self.by_url, (prefix,))
+        end: int = bisect_left(self.by_url, (prefix + "\U0010ffff",), start)
+
+        nodes = [node for _, node in self.by_url[start + offset : min(start + offset + limit, end)]]
+        return nodes, end - start
+
+    def layout(self) -> Tuple[array, array]:
+        n: int = self.graph.n_nodes()
+        path: str = self.layout_path or self.path + LAYOUT_SUFFIX
+
+        # Stored snapshots never change; graph files can be rewritten
+        if os.path.exists(path) and (
+            self.layout_path is not None or os.path.getmtime(path) >= os.path.getmtime(self.path)
+        ):
+            x: array = array("f")
+            y: array = array("f")
+            with open(path, "rb") as fd:
+                x.fromfile(fd, n)
+                y.fromfile(fd, n)
+            return x, y
+
+        x, y = self.radial_layout()
+        with open(path + ".tmp", "wb") as fd:
+            x.tofile(fd)
+            y.tofile(fd)
+        os.replace(path + ".tmp", path)
+        return x, y
+
+    def radial_layout(self) -> Tuple[array, array]:
+        # Hosts get angular sectors sized by their page count; within a sector,
+        # better connected pages sit closer to the centre. O(n log n), no iterations.
+        n: int = self.graph.n_nodes()
+        hosts: Dict[str, List[int]] = {}
+        for node in self.by_degree:
+            hosts.setdefault(urlsplit(self.graph.urls[node]).netloc, []).append(node)
+
+        rank: List[int] = [0] * n
+        for position, node in enumerate(self.by_degree):
+            rank[node] = position
+
+        x: array = array("f", bytes(4 * n))
+        y: array = array("f", bytes(4 * n))
+        angle: float = 0.0
+        for host in sorted(hosts, key=lambda host: (-len(hosts[host]), zlib.crc32(host.encode()))):
+            nodes: List[int] = hosts[host]
+            width: float = 2 * math.pi * len(nodes) / max(n, 1)
+            for i, node in enumerate(nodes):
+                theta: float = angle + width * (i + 0.5) / len(nodes)
+                radius: float = LAYOUT_RADIUS * math.sqrt((rank[node] + 1) / n)
+                x[node] = radius * math.cos(theta)
+                y[node] = radius * math.sin(theta)
+            angle += width
+        return x, y
+
+    def elements(self, nodes: List[int]) -> Dict[str, List[dict]]:
+        # Cytoscape elements with preset positions; edges between the selected nodes only
+        selected: Set[int] = set(nodes)
+        urls: List[str] = self.graph.urls
+
+        elements = {"nodes": [], "edges": []}
+        for node in nodes:
+            title: Optional[str] = self.graph.titles[node]
+            elements["nodes"].append(
+                {
+                    "data": {
+                        "id": urls[node],
+                        "name": urls[node],
+                        "label": title or urls[node],
+                        "description": title,
+                        "degree": self.degrees[node],
+                    },
+                    "position": {"x": self.x[node], "y": self.y[node]},
+                }
+            )
+            for target in self.out_edges[self.out_offsets[node] : self.out_offsets[node + 1]]:
+                if target in selected:
+                    elements["edges"].append(
+                        {"data": {"source": urls[node], "target": urls[target]}}
+                    )
+        return elements
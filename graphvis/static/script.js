@@ -1,49 +1,75 @@
-fetch("/graph").then((raw) => {
-    raw.json().then((data) => {
-        console.log("Got graph from /graph")
-        const cy = cytoscape({
-            container: document.getElementById('cy'),
-            layout: {
-                name: 'cose-bilkent',
-                idealEdgeLength: 100,
-                nodeOverlap: 20,
-                refresh: 20,
-                fit: true,
-                padding: 30,
-                randomize: false,
-                componentSpacing: 100,
-                nodeRepulsion: 400000,
-                edgeElasticity: 100,
-                nestingFactor: 5,
-                gravity: 80,
-                numIter: 1000,
-                initialTemp: 200,
-                coolingFactor: 0.95,
-                minTemp: 1.0
-            },
-
-            // Specify style options
-            style: [
-                {
-                    selector: 'node',
-                    style: {
-                        'background-color': '#666',
-                        'label': 'data(label)'
-                    }
-                },
-                {
-                    selector: 'edge',
-                    style: {
-                        'width': 3,
-                        'line-color': '#ccc',
-                        'target-arrow-color': '#ccc',
-                        'target-arrow-shape': 'triangle'
-                    }
-                }
-            ],
-
-            // Load JSON data
-            elements: data
+// Subgraphs come from the server with precomputed positions, so no layout runs here
+const cy = cytoscape({
+    container: document.getElementById('cy'),
+    layout: { name: 'preset' },
+
+    // Specify style options
+    style: [
+        {
+            selector: 'node',
+            style: {
+                'background-color': '#666',
+                'label': 'data(label)',
+                'width': 'mapData(degree, 0, 100, 10, 60)',
+                'height': 'mapData(degree, 0, 100, 10, 60)'
+            }
+        },
+        {
+            selector: 'edge',
+            style: {
+                'width': 3,
+                'line-color': '#ccc',
+                'target-arrow-color': '#ccc',
+                'target-arrow-shape': 'triangle'
+            }
+        }
+    ]
+});
+
+function load(path, params) {
+    const status = document.getElementById('status');
+    fetch(path + '?' + new URLSearchParams(params)).then((raw) => {
+        raw.json().then((data) => {
+            if (data.error !== undefined) {
+                status.innerText = data.error;
+                return;
+            }
+
+            cy.elements().remove();
+            cy.add(data.nodes);
+            cy.add(data.edges);
+            cy.layout({ name: 'preset', fit: true, padding: 30 }).run();
+
+            status.innerText = `${data.nodes.length} nodes, ${data.edges.length} edges` +
+                (data.total !== undefined ? ` (${data.total} matching)` : '');
         });
     });
-})
\ No newline at end of file
+}
+
+function limit() {
+    return document.getElementById('limit').value;
+}
+
+document.getElementById('top').onclick = () => {
+    load('/subgraph/top', { limit: limit() });
+};
+
+document.getElementById('neighborhood').onclick = () => {
+    load('/subgraph/neighborhood', {
+        url: document.getElementById('query').value,
+        hops: document.getElementById('hops').value,
+        limit: limit()
+    });
+};
+
+document.getElementById('prefix').onclick = () => {
+    load('/subgraph/prefix', { prefix: document.getElementById('query').value, limit: limit() });
+};
+
+// Double clicking a node shows its neighborhood
+cy.on('dbltap', 'node', (event) => {
+    document.getElementById('query').value = event.target.id();
+    document.getElementById('neighborhood').click();
+});
+
+load('/subgraph/top', { limit: limit() });
@@ -1,9 +1,12 @@
 import argparse
+import itertools
 import os
 import sys
+from typing import List, Optional
 from indexer import IndexManager
+from tokenization import TOKENIZERS, benchmark, get_tokenizer
 import logging
-import nltk
+import ujson as json
 
 sys.path.extend([os.getcwd()])
 from models import *
@@ -31,15 +34,66 @@ def main(args):
             format=LOGGING_FORMAT,
         )
 
+    if args.benchmark:
+        run_benchmark(crawlopts, args.benchmark, args.tokenizers)
+        return
+
     manager = IndexManager(crawlopts, profiles)
     manager.process()
     manager.save()
 
+    # Compact once too many segments pile up
+    if args.merge or len(manager.manifest.segments) > crawlopts.max_segments:
+        manager.merge(full=args.merge)
+
+
+def run_benchmark(crawlopts: CrawlConfig, pages: int, names: Optional[List[str]] = None):
+    from storage.packfile import PackStore
+
+    # By default skip tokenizers whose data would have to be downloaded first
+    if names is None:
+        names = []
+        for name, tokenizer in TOKENIZERS.items():
+            if tokenizer.available():
+                names.append(name)
+            else:
+                logging.warning("Skipping the %s tokenizer: its data is not downloaded", name)
+    for name in names:
+        get_tokenizer(name)
+
+    store = PackStore(crawlopts.cache_dir)
+    sample = [store.get(hash) for hash in itertools.islice(store.hashes(), pages)]
+    store.close()
+
+    results = benchmark(sample, names)
+    print(json.dumps(results, indent=2))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-config", required=True, help="Path to the config file")
+    parser.add_argument(
+        "-merge",
+        help="Merge all index segments into one",
+        required=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-benchmark",
+        help="Time every tokenizer on this many cached pages, without indexing",
+        required=False,
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "-tokenizers",
+        help="Comma separated tokenizers to benchmark (default: every one whose data is available)",
+        required=False,
+        type=lambda value: value.split(","),
+        default=None,
+    )
 
     args = parser.parse_args()
     main(args)
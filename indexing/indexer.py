@@ -1,5 +1,4 @@
 import logging
-from bs4 import BeautifulSoup
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy import Engine
@@ -7,37 +6,54 @@ from sqlalchemy import Engine
 import time
 import sys
 import os
+import shutil
 import zlib
-import nltk
-from collections import defaultdict
-from nltk.corpus import stopwords
-from nltk.collocations import BigramAssocMeasures, BigramCollocationFinder
-from typing import Set, Dict, List
+from array import array
+from collections import Counter
+from itertools import chain
+from typing import Optional, Set, Dict, List, Tuple
+from functools import partial
 from pqdm.processes import pqdm
-from unidecode import unidecode
-import pickle
+from tokenization import FastTokenizer, Positions, get_tokenizer
 
 sys.path.extend([os.getcwd()])
-from models import CrawlConfig, ProfileConfig, URLData
+from models import CrawlConfig, ProfileConfig, latest_documents
+from storage.packfile import PackStore
+from storage.index_file import DocInfo, IndexReader, IndexWriter
+from storage.ranks import rank_path, read_ranks, write_ranks
+from storage.segments import MERGE_FACTOR, SegmentManifest, merge_segments, merge_window
+from storage.runs import Postings, merge_runs, read_texts, reduce_runs, write_run, write_texts
 
-STOPWORDS = set(stopwords.words())
-REMOVE = set(".!#()*&^")
 logger: logging.Logger = logging.getLogger("Indexer")
 
 
 class IndexManager:
     def __init__(self, crawlopts: CrawlConfig, profiles: List[ProfileConfig]) -> None:
 
-        logging.debug("Downloading nltk corpora")
-        nltk.download("punkt")
-        nltk.download("stopwords")
-        logging.debug("Finished Downloading corpora")
-
         self.crawlopts: CrawlConfig = crawlopts
+        self.tokenizer = get_tokenizer(crawlopts.tokenizer)
+
+        # Corpora are only needed by the nltk tokenizer
+        logging.debug("Setting up the %s tokenizer", crawlopts.tokenizer)
+        self.tokenizer.setup()
+
         self.profiles: List[ProfileConfig] = profiles
 
         self.sessionmakers: Dict[str, sessionmaker] = {}
-        self.bigram_map = defaultdict(set)
+        self.doc_hashes: List[str] = []
+        self.doc_lengths: List[int] = []
+
+        # Latest url, time, profile and title per hash, stored in the segment
+        self.doc_info: Dict[str, DocInfo] = {}
+
+        # Sorted partial postings, one run per chunk
+        self.run_dir: str = os.path.join(self.crawlopts.index, "runs")
+        self.runs: List[str] = []
+        self.texts: List[str] = []
+        self.timings: Dict[str, float] = {}
+
+        # Live index segments
+        self.manifest: SegmentManifest = SegmentManifest.load(self.crawlopts.index)
 
         for profile in self.profiles:
             engine: Engine = create_engine(
@@ -49,40 +65,179 @@ class IndexManager:
             self.sessionmakers[profile.profile_name] = sessionmaker(bind=engine)
 
     def process(self):
-        token_pairs = self.get_all_data()
-        self.group_tokens(token_pairs)
-
-    def get_all_data(self) -> List[Dict[str, Set[str]]]:
-        hashes = []
+        self.doc_hashes = self.get_all_data()
+        self.tokenize()
 
+    def get_all_data(self) -> List[str]:
+        t_start = time.perf_counter()
         for _, sessionmaker in self.sessionmakers.items():
-            for query in sessionmaker().query(URLData.hash.distinct()).all():
-                hashes.append(str(query[0]))
+            with sessionmaker() as session:
+                for hash, url, crawl_time, profile, title in latest_documents(session):
+                    previous: Optional[DocInfo] = self.doc_info.get(hash)
+                    if previous is None or crawl_time > previous[1]:
+                        self.doc_info[hash] = (url, crawl_time, profile, title)
+
+        # Only pages missing from every segment
+        distinct: Set[str] = set(self.doc_info)
+        indexed: Set[str] = self.indexed_hashes()
+        logger.info("Skipping %d already indexed pages", len(distinct & indexed))
+        distinct -= indexed
+
+        # Read pages in packfile order (sequential reads)
+        store: PackStore = Indexer.open_store(self.crawlopts.cache_dir)
+        worker_args = sorted((hash for hash in distinct if hash in store), key=store.locate)
+
+        logger.info("Found %d URLs to index", len(worker_args))
+        if len(worker_args) != len(distinct):
+            logger.warning("%d pages missing from the cache", len(distinct) - len(worker_args))
+
+        self.timings["scan"] = time.perf_counter() - t_start
+        return worker_args
 
-        logger.info("Found %d URLs to index", len(hashes))
+    def tokenize(self):
+        # Map: each worker tokenizes a chunk of pages into a sorted run on disk
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+        os.makedirs(self.run_dir)
 
-        worker_args = []
-        for hash in hashes:
-            worker_args.append(os.path.join(self.crawlopts.cache_dir, hash))
+        size: int = self.crawlopts.index_chunk
+        chunks = [
+            (i // size, i, self.doc_hashes[i : i + size])
+            for i in range(0, len(self.doc_hashes), size)
+        ]
 
-        logger.info("Indexing with %d workers.", self.crawlopts.workers)
+        logger.info("Indexing %d chunks with %d workers.", len(chunks), self.crawlopts.workers)
         t_start = time.perf_counter()
 
-        token_pairs = pqdm(worker_args, Indexer.worker, self.crawlopts.workers, exception_behaviour="immediate")
+        results = pqdm(
+            chunks,
+            partial(
+                Indexer.chunk_worker,
+                self.crawlopts.cache_dir,
+                self.run_dir,
+                self.crawlopts.tokenizer,
+                self.crawlopts.positions,
+                self.crawlopts.snippet_text,
+            ),
+            self.crawlopts.workers,
+            exception_behaviour="immediate",
+        )
 
-        t_end = time.perf_counter()
-        logger.info("Finished indexing in %.2fs", t_end - t_start)
+        for chunk, lengths in sorted(results):
+            self.doc_lengths.extend(lengths)
+            self.runs.append(Indexer.run_path(self.run_dir, chunk))
+            if self.crawlopts.snippet_text:
+                self.texts.append(Indexer.text_path(self.run_dir, chunk))
 
-        return token_pairs
+        self.timings["map"] = time.perf_counter() - t_start
+        logger.info("Finished tokenizing in %.2fs", self.timings["map"])
 
-    def group_tokens(self, token_pairs):
-        for hash, bigrams in token_pairs:
-            for bigram in bigrams:
-                self.bigram_map[bigram].add(hash)
+    def indexed_hashes(self) -> Set[str]:
+        hashes: Set[str] = set()
+        for path in self.manifest.paths():
+            reader = IndexReader(path)
+            hashes.update(reader.doc_hash(doc_id) for doc_id in range(reader.n_docs))
+            reader.close()
+        return hashes
 
     def save(self):
-        with open(self.crawlopts.index, "wb+") as fd:
-            pickle.dump(self.bigram_map, fd)
+        if not self.doc_hashes:
+            logger.info("Index is up to date (%d segments)", len(self.manifest.segments))
+            return
+
+        t_start = time.perf_counter()
+        segment: str = self.manifest.new_segment()
+        writer = IndexWriter(
+            self.manifest.path(segment), self.crawlopts.positions, bool(self.texts)
+        )
+
+        # Text side files are in chunk order, like the documents
+        texts = chain.from_iterable(read_texts(path) for path in self.texts)
+        for hash, length in zip(self.doc_hashes, self.doc_lengths):
+            writer.add_document(hash, length, self.doc_info.get(hash), next(texts, None))
+
+        # Reduce: k-way merge of the runs, streamed into the segment
+        terms: int = 0
+        for term, (doc_ids, freqs, positions) in merge_runs(reduce_runs(self.runs, self.run_dir)):
+            writer.add_term(term, doc_ids, freqs, positions)
+            terms += 1
+
+        writer.close()
+        shutil.rmtree(self.run_dir)
+        self.timings["merge"] = time.perf_counter() - t_start
+
+        # Publish the new segment
+        self.manifest.segments.append(segment)
+        self.manifest.save()
+
+        logger.info(
+            "Saved segment %s (%d terms, %d documents, %.2f MB)",
+            segment,
+            terms,
+            len(self.doc_hashes),
+            os.path.getsize(self.manifest.path(segment)) / 1e6,
+        )
+        logger.info(
+            "Index build stages: %s",
+            ", ".join(f"{stage} {t_taken:.2f}s" for stage, t_taken in self.timings.items()),
+        )
+
+    def merge(self, full: bool = False):
+        names: List[str] = list(self.manifest.segments)
+        if len(names) < 2:
+            return
+
+        # Everything, or the cheapest run that gets back under max_segments
+        if full:
+            start, end = 0, len(names)
+        else:
+            count: int = max(MERGE_FACTOR, len(names) - self.crawlopts.max_segments + 1)
+            count = min(count, len(names))
+            start = merge_window([os.path.getsize(self.manifest.path(name)) for name in names], count)
+            end = start + count
+
+        t_start = time.perf_counter()
+        previous: List[str] = names[start:end]
+        paths: List[str] = [self.manifest.path(name) for name in previous]
+        readers: List[IndexReader] = [IndexReader(path) for path in paths]
+
+        # Searches keep using the old segments until the manifest is replaced
+        segment: str = self.manifest.new_segment()
+        # Positions survive only if every segment has them
+        writer = IndexWriter(
+            self.manifest.path(segment),
+            all(reader.positional for reader in readers),
+            any(reader.has_text for reader in readers),
+        )
+        merge_segments(readers, writer)
+        writer.close()
+
+        # Documents are concatenated in segment order, and so are their link scores
+        ranks = [read_ranks(path, reader.n_docs) for path, reader in zip(paths, readers)]
+        if all(rank is not None for rank in ranks):
+            write_ranks(
+                self.manifest.path(segment),
+                array("f", chain.from_iterable(authority for authority, _ in ranks)),
+                array("I", chain.from_iterable(degree for _, degree in ranks)),
+            )
+
+        # The merged segment takes the place of its run, keeping segment order
+        self.manifest.segments = names[:start] + [segment] + names[end:]
+        self.manifest.save()
+
+        for reader in readers:
+            reader.close()
+        for name in previous:
+            os.remove(self.manifest.path(name))
+            if os.path.exists(rank_path(self.manifest.path(name))):
+                os.remove(rank_path(self.manifest.path(name)))
+
+        logger.info(
+            "Merged %d of %d segments into %s in %.2fs",
+            len(previous),
+            len(names),
+            segment,
+            time.perf_counter() - t_start,
+        )
 
     def __del__(self):
         for _, v in self.sessionmakers.items():
@@ -90,26 +245,75 @@ class IndexManager:
 
 
 class Indexer:
+    # Opened once per process (inherited by forked workers)
+    store: Optional[PackStore] = None
+
     @staticmethod
-    def worker(src):
-        with open(src, "rb") as fd:
-            content: bytes = zlib.decompress(fd.read())
+    def open_store(cache_dir: str) -> PackStore:
+        if Indexer.store is None:
+            Indexer.store = PackStore(cache_dir)
+        return Indexer.store
 
-        doctext: str = BeautifulSoup(content.decode(), "lxml").get_text(separator=".\n")
-        tokens: Set[str] = Indexer.get_tokens(doctext)
-        return (os.path.basename(src), tokens)
+    @staticmethod
+    def run_path(run_dir: str, chunk: int) -> str:
+        return os.path.join(run_dir, f"chunk-{chunk:06d}.run")
 
     @staticmethod
-    def get_tokens(document: str) -> Set[str]:
-        tokens = set(
-            [
-                unidecode(token.casefold())
-                for token in nltk.word_tokenize(document)
-                if token.lower() not in STOPWORDS and token not in REMOVE
-            ]
-        )
+    def text_path(run_dir: str, chunk: int) -> str:
+        return os.path.join(run_dir, f"chunk-{chunk:06d}.text")
+
+    @staticmethod
+    def chunk_worker(
+        cache_dir: str,
+        run_dir: str,
+        tokenizer: str,
+        positional: bool,
+        text_chars: int,
+        chunk: Tuple[int, int, List[str]],
+    ) -> Tuple[int, List[int]]:
+        number, base, hashes = chunk
+
+        # Doc ids of a chunk are consecutive, starting at `base`
+        postings: Dict[str, Postings] = {}
+        lengths: List[int] = []
+        texts: List[bytes] = []
+        for doc_id, hash in enumerate(hashes, start=base):
+            _, tokens, length, positions, text = Indexer.worker(
+                cache_dir, tokenizer, hash, positional, text_chars
+            )
+            lengths.append(length)
+            if text_chars:
+                texts.append(zlib.compress(text.encode()))
+
+            for term, freq in tokens.items():
+                doc_ids, freqs, term_positions = postings.setdefault(
+                    term, ([], [], [] if positional else None)
+                )
+                doc_ids.append(doc_id)
+                freqs.append(freq)
+                if positional:
+                    term_positions.append(positions.get(term, []))
+
+        write_run(Indexer.run_path(run_dir, number), postings)
+        if text_chars:
+            write_texts(Indexer.text_path(run_dir, number), texts)
+        return number, lengths
+
+    @staticmethod
+    def worker(
+        cache_dir: str, tokenizer: str, hash: str, positional: bool = False, text_chars: int = 0
+    ) -> Tuple[str, Counter, int, Optional[Positions], Optional[str]]:
+        content: bytes = zlib.decompress(Indexer.open_store(cache_dir).get(hash))
 
-        finder = BigramCollocationFinder.from_words(tokens)
-        scored_bigrams = finder.score_ngrams(BigramAssocMeasures.pmi)
+        splitter = get_tokenizer(tokenizer)
+        doctext: str = splitter.text(content)
+        tokens, length, positions = splitter.get_tokens(doctext, positional)
 
-        return set([" ".join(bigram) for bigram, _ in scored_bigrams[:100]]) | set(tokens)
+        # Whitespace collapsed and truncated copy, for result snippets. Always
+        # the fast path's text: nltk's keeps scripts, styles and "." separators
+        text: Optional[str] = None
+        if text_chars:
+            if splitter is not FastTokenizer:
+                doctext = FastTokenizer.text(content)
+            text = " ".join(doctext.split())[:text_chars]
+        return (hash, tokens, length, positions, text)
@@ -0,0 +1,183 @@
+import re
+import time
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Term -> positions in the document's token stream (stopwords keep their slot)
+Positions = Dict[str, List[int]]
+
+from lxml import etree, html
+from unidecode import unidecode
+
+# Bundled so the fast tokenizer works without the nltk corpora
+STOPWORDS: Set[str] = set(
+    """
+    a about above after again against all am an and any are as at be because
+    been before being below between both but by can cannot could did do does
+    doing down during each few for from further had has have having he her
+    here hers herself him himself his how i if in into is it its itself me
+    more most my myself no nor not of off on once only or other ought our
+    ours ourselves out over own same she should so some such than that the
+    their theirs them themselves then there these they this those through to
+    too under until up very was we were what when where which while who whom
+    why will with would you your yours yourself yourselves s t d ll m re ve
+    aren couldn didn doesn don hadn hasn haven isn let mustn shan shouldn
+    wasn weren won wouldn
+    """.split()
+)
+
+# Text is transliterated and casefolded first, so ascii alphanumerics cover it
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+REMOVE = set(".!#()*&^")
+
+
+class NltkTokenizer:
+    stopwords: Optional[Set[str]] = None
+
+    @staticmethod
+    def setup():
+        import nltk
+
+        nltk.download("punkt")
+        nltk.download("stopwords")
+
+    @staticmethod
+    def available() -> bool:
+        # True when the corpora are already downloaded, so setup needs no network
+        try:
+            import nltk
+
+            nltk.data.find("tokenizers/punkt")
+            nltk.data.find("corpora/stopwords")
+        except (ImportError, LookupError):
+            return False
+        return True
+
+    @staticmethod
+    def text(content: bytes) -> str:
+        from bs4 import BeautifulSoup
+
+        return BeautifulSoup(content.decode(), "lxml").get_text(separator=".\n")
+
+    @staticmethod
+    def words(document: str) -> List[Tuple[int, str]]:
+        import nltk
+
+        # Loaded on first use, once per process
+        if NltkTokenizer.stopwords is None:
+            from nltk.corpus import stopwords
+
+            NltkTokenizer.stopwords = set(stopwords.words())
+
+        return [
+            (position, unidecode(token.casefold()))
+            for position, token in enumerate(nltk.word_tokenize(document))
+            if token.lower() not in NltkTokenizer.stopwords and token not in REMOVE
+        ]
+
+    @staticmethod
+    def get_tokens(
+        document: str, positions: bool = False
+    ) -> Tuple[Counter, int, Optional[Positions]]:
+        from nltk.collocations import BigramAssocMeasures, BigramCollocationFinder
+
+        stream: List[Tuple[int, str]] = NltkTokenizer.words(document)
+        words: List[str] = [word for _, word in stream]
+
+        # Term frequencies, plus the top 100 bigrams by PMI
+        tokens = Counter(words)
+        finder = BigramCollocationFinder.from_words(words)
+        for bigram, _ in finder.score_ngrams(BigramAssocMeasures.pmi)[:100]:
+            tokens[" ".join(bigram)] = finder.ngram_fd[bigram]
+
+        return tokens, len(words), term_positions(stream) if positions else None
+
+
+class FastTokenizer:
+    @staticmethod
+    def setup():
+        pass
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    @staticmethod
+    def text(content: bytes) -> str:
+        if not content.strip():
+            return ""
+
+        try:
+            root = html.fromstring(content)
+        except (etree.ParserError, ValueError):
+            return ""
+
+        for node in list(root.iter("script", "style", "noscript")):
+            if node.getparent() is not None:
+                node.drop_tree()
+        return " ".join(root.itertext())
+
+    @staticmethod
+    def words(document: str) -> List[Tuple[int, str]]:
+        return [
+            (position, word)
+            for position, word in enumerate(TOKEN_RE.findall(unidecode(document).casefold()))
+            if word not in STOPWORDS
+        ]
+
+    @staticmethod
+    def get_tokens(
+        document: str, positions: bool = False
+    ) -> Tuple[Counter, int, Optional[Positions]]:
+        stream: List[Tuple[int, str]] = FastTokenizer.words(document)
+        words: List[str] = [word for _, word in stream]
+
+        # Term frequencies, plus the 100 most frequent bigrams in document order
+        tokens = Counter(words)
+        bigrams = Counter(zip(words, words[1:]))
+        for bigram, freq in bigrams.most_common(100):
+            tokens[" ".join(bigram)] = freq
+
+        return tokens, len(words), term_positions(stream) if positions else None
+
+
+def term_positions(stream: List[Tuple[int, str]]) -> Positions:
+    positions: Positions = {}
+    for position, word in stream:
+        positions.setdefault(word, []).append(position)
+    return positions
+
+
+TOKENIZERS = {"nltk": NltkTokenizer, "fast": FastTokenizer}
+
+
+def get_tokenizer(name: str):
+    if name not in TOKENIZERS:
+        raise ValueError(f"Unknown tokenizer: {name}")
+    return TOKENIZERS[name]
+
+
+def benchmark(pages: Iterable[bytes], names: Iterable[str]) -> Dict[str, Dict[str, float]]:
+    # Pages are zlib compressed, as stored in the cache
+    documents: List[bytes] = [zlib.decompress(page) for page in pages]
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name in names:
+        tokenizer = get_tokenizer(name)
+        tokenizer.setup()
+
+        tokens: int = 0
+        t_start = time.perf_counter()
+        for content in documents:
+            _, length, _ = tokenizer.get_tokens(tokenizer.text(content))
+            tokens += length
+        t_taken: float = time.perf_counter() - t_start
+
+        results[name] = {
+            "pages": len(documents),
+            "tokens": tokens,
+            "seconds": t_taken,
+            "pages_per_sec": len(documents) / t_taken if t_taken else 0.0,
+        }
+    return results
@@ -1,10 +1,10 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String, func, inspect
 from sqlalchemy.ext.declarative import declarative_base
 
 import os
 import time
 import datetime
-from typing import Coroutine, List
+from typing import Iterable, List, Optional
 import re
 import toml
 
@@ -22,6 +22,49 @@ class URLData(Base):
     hash = Column(String(64), nullable=False)
     title = Column(String, nullable=False)
 
+    # Incremental crawls
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    links = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_urldata_hash", "hash"),
+        Index("ix_urldata_url", "url"),
+        Index("ix_urldata_profile_time", "profile_name", "time"),
+    )
+
+
+def upgrade_schema(connection):
+    # Databases created by older versions are missing columns and indexes
+    Base.metadata.create_all(connection)
+
+    table = URLData.__table__
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                f"{column.type.compile(connection.dialect)}"
+            )
+
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def latest_documents(session, hashes: Optional[Iterable[str]] = None):
+    # (hash, url, time, profile_name, title) of the newest row per hash.
+    # SQLite fills the bare columns from the row holding MAX(time).
+    query = session.query(
+        URLData.hash,
+        URLData.url,
+        func.max(URLData.time),
+        URLData.profile_name,
+        URLData.title,
+    )
+    if hashes is not None:
+        query = query.filter(URLData.hash.in_(list(hashes)))
+    return query.group_by(URLData.hash).all()
+
 
 class CrawlConfig:
     def __init__(self, options, make_dirs=True):
@@ -33,9 +76,43 @@ class CrawlConfig:
         self.timestamp: str = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
         self.unix_time: int = int(time.time())
         self.graph_ts_dir = os.path.join(self.graph_dir, self.timestamp)
-        self.profile = options["profile"]
+        # cProfile stages; `true` profiles the whole run like older versions
+        profile = options["profile"]
+        if profile is True:
+            profile = ["loop"]
+        elif isinstance(profile, str):
+            profile = [profile]
+        self.profile: List[str] = list(profile or [])
         self.workers: int = options["workers"]
         self.index: str = options["index"]
+        self.concurrency: int = options.get("concurrency", 32)
+        self.cache_writers: int = options.get("cache_writers", 4)
+        self.cache_queue: int = options.get("cache_queue", 256)
+        self.pack_size: int = options.get("pack_size", 256) << 20
+        self.parse_pool: str = options.get("parse_pool", "process")
+        self.parse_workers: int = options.get("parse_workers", 0)
+        self.parse_batch: int = options.get("parse_batch", 16)
+        self.db_batch: int = options.get("db_batch", 500)
+        self.db_interval: float = options.get("db_interval", 5)
+        self.frontier_dir: str = options.get("frontier_dir", "./frontier")
+        self.checkpoint_dir: str = options.get("checkpoint_dir", "./checkpoints")
+        self.checkpoint_interval: float = options.get("checkpoint_interval", 300)
+        self.incremental: bool = options.get("incremental", False)
+        self.fuzzy_candidates: int = options.get("fuzzy_candidates", 200)
+        self.max_segments: int = options.get("max_segments", 8)
+        self.index_chunk: int = options.get("index_chunk", 500)
+        self.tokenizer: str = options.get("tokenizer", "nltk")
+        self.positions: bool = options.get("positions", False)
+        self.graph_format: str = options.get("graph_format", "json")
+        self.graph_snapshots: bool = options.get("graph_snapshots", True)
+        self.graph_rebase: int = options.get("graph_rebase", 10)
+        self.snippet_text: int = options.get("snippet_text", 20000)
+        self.snippet_length: int = options.get("snippet_length", 200)
+        self.rank_weight: float = options.get("rank_weight", 0.5)
+        self.query_cache: int = options.get("query_cache", 1024)
+        self.query_cache_ttl: float = options.get("query_cache_ttl", 300)
+        self.reload_interval: float = options.get("reload_interval", 5)
+        self.metrics_port: int = options.get("metrics_port", 0)
 
         # Create missing folders
         if make_dirs:
@@ -60,6 +137,12 @@ class CrawlConfig:
         if self.database_dir and not os.path.exists(self.database_dir):
             os.makedirs(self.database_dir)
 
+        if not os.path.exists(self.frontier_dir):
+            os.makedirs(self.frontier_dir)
+
+        if not os.path.exists(self.checkpoint_dir):
+            os.makedirs(self.checkpoint_dir)
+
 
 class ProfileConfig:
     def __init__(self, profile_name, profile):
@@ -67,6 +150,10 @@ class ProfileConfig:
         self.locations: List[str] = profile["locations"]
         self.depth: int = profile["depth"]
 
+        # Large crawl mode (frontier = "disk")
+        self.frontier: str = profile.get("frontier", "memory")
+        self.bloom_capacity: int = profile.get("bloom_capacity", 10_000_000)
+
         self.filters: List[re.Pattern] = [
             re.compile(pattern) for pattern in profile["filter"]
         ]
@@ -75,9 +162,6 @@ class ProfileConfig:
             re.compile(pattern) for pattern in profile["match"]
         ]
 
-        # File save tasks
-        self.tasks: List[Coroutine] = []
-
     @staticmethod
     def load_profiles(config):
         with open(config) as fd:
@@ -1 +1,33 @@
-from models import *
+import argparse
+import os
+import sys
+
+from sqlalchemy import create_engine
+
+sys.path.extend([os.getcwd()])
+from models import *
+
+
+def main(args):
+    crawlopts = CrawlConfig.load_config(args.config, make_dirs=False)
+    profiles = ProfileConfig.load_profiles(args.config)
+
+    # Bring existing databases up to the current schema
+    for profile in profiles:
+        path = os.path.join(crawlopts.database_dir, f"{profile.profile_name}.db")
+        if not os.path.exists(path):
+            continue
+
+        engine = create_engine("sqlite:///" + path)
+        with engine.begin() as conn:
+            upgrade_schema(conn)
+        engine.dispose()
+        print(f"Upgraded {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-config", help="Path to the config file", required=True)
+
+    args = parser.parse_args()
+    main(args)
@@ -7,6 +7,7 @@ from sqlalchemy.orm import sessionmaker, Session
 sys.path.extend([os.getcwd()])
 from models import *
 from search import *
+from storage.index_file import SUGGEST_TOP
 
 import traceback
 import argparse
@@ -15,6 +16,7 @@ from flask_cors import CORS
 import logging
 
 logger: logging.Logger = logging.getLogger("SearchEngine")
+MAX_LIMIT = 100
 
 
 def main(args) -> None:
@@ -40,39 +42,50 @@ def main(args) -> None:
         sessionmakers[profile.profile_name] = sessionmaker(bind=engine)
 
     searcher: Search = Search(crawlopts)
+    searcher.watch(crawlopts.reload_interval)
+
     app = Flask(__name__)
-    CORS(app, resources={r"/search": {"origins": "*"}})
+    CORS(app, resources={r"/search": {"origins": "*"}, r"/suggest": {"origins": "*"}})
 
-    def get_hash_info(hash: str):
+    def get_hash_info(hashes: List[str]) -> Dict[str, Tuple[str, int, str, str]]:
+        # One batched lookup per profile; sessions hand their connection back to the pool
+        found: Dict[str, Tuple[str, int, str, str]] = {}
         for _, sessionmaker in sessionmakers.items():
-            session: Session = sessionmaker()
-
-            result = session.query(URLData).filter(URLData.hash == hash).order_by(URLData.time.desc()).first()
-            if result:
-                return (
-                    str(result.url),
-                    int(result.time),
-                    str(result.profile_name),
-                    str(result.title),
-                )
-            
-            session.close_all()
+            with sessionmaker() as session:
+                for hash, url, crawl_time, profile, title in latest_documents(session, hashes):
+                    if hash not in found or crawl_time > found[hash][1]:
+                        found[hash] = (str(url), int(crawl_time), str(profile), str(title))
+        return found
 
     @app.route("/search")
     def search():
         try:
             t_start = time.perf_counter()
             query = request.args.get("search").casefold()
+            limit = min(request.args.get("limit", 10, type=int), MAX_LIMIT)
+            offset = max(request.args.get("offset", 0, type=int), 0)
             results = []
 
-            for hash in searcher.search(query):
-                url, timestamp, profile, title = get_hash_info(hash)
+            # Newest row per hash, as segment metadata is frozen at index time;
+            # the segment copy covers pages whose rows are gone
+            hits = searcher.search(query, limit, offset)
+            hydrated = get_hash_info([hash for hash, _, _, _ in hits]) if hits else {}
+
+            for hash, score, info, snippet in hits:
+                info = hydrated.get(hash) or info
+                if info is None:
+                    logger.debug("No metadata for %s", hash)
+                    continue
+
+                url, timestamp, profile, title = info
                 results.append(
                     {
                         "url": url,
                         "timestamp": timestamp,
                         "profile": profile,
                         "title": title,
+                        "score": score,
+                        "snippet": snippet,
                     }
                 )
 
@@ -83,6 +96,21 @@ def main(args) -> None:
             logger.error("%s", traceback.format_exc())
             return jsonify({})
 
+    @app.route("/suggest")
+    def suggest():
+        prefix = request.args.get("q", "").casefold().strip()
+        limit = min(max(request.args.get("limit", SUGGEST_TOP, type=int), 1), SUGGEST_TOP)
+        if not prefix:
+            return jsonify([])
+
+        return jsonify(
+            [{"term": term, "docs": df} for term, df in searcher.suggest(prefix, limit)]
+        )
+
+    @app.route("/stats")
+    def stats():
+        return jsonify(searcher.stats())
+
     if crawlopts.debug:
         app.run(host="localhost", port=8000, debug=True)
     else:
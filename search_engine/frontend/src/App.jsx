@@ -16,12 +16,14 @@ function displayError(err) {
 function App() {
     const [err, SetErr] = useState({});
     const [resultView, setResultView] = useState();
+    const [suggestions, setSuggestions] = useState([]);
 
     function Result(props, key) {
         return <>
         <Card className='m-1 text-left p-3'>
             <b> {props.title} </b>
             <a href={props.url}> {props.url} </a>
+            {props.snippet && <p className='mb-1' dangerouslySetInnerHTML={{ __html: props.snippet }} />}
             <span className='text-muted'>
                 {new Date(props.timestamp * 1000).toDateString() + "     "}
                 {props.profile}
@@ -30,6 +32,25 @@ function App() {
         </>
     }
 
+    async function Suggest(event) {
+        const prefix = event.target.value.toLowerCase().trim();
+        if (prefix === "") {
+            setSuggestions([]);
+            return;
+        }
+
+        try {
+            const results = await (await fetch(`http://localhost:8000/suggest?q=${encodeURIComponent(prefix)}`)).json()
+
+            // Drop responses for a prefix the user has already typed past
+            if (event.target.value.toLowerCase().trim() === prefix) {
+                setSuggestions(results.map((r) => r.term))
+            }
+        } catch (e) {
+            setSuggestions([])
+        }
+    }
+
     async function Search() {
         try{
             const query = document.getElementsByTagName("input")[0].value.toLowerCase();
@@ -59,7 +80,10 @@ function App() {
                     <hr />
 
                     <div className='d-flex p-2'>
-                        <input type="text" className='form-control m-1' placeholder='Keywords here' />
+                        <input type="text" className='form-control m-1' placeholder='Keywords here' list='suggestions' onChange={Suggest} />
+                        <datalist id='suggestions'>
+                            {suggestions.map((term) => <option key={term} value={term} />)}
+                        </datalist>
                         <Button onClick={Search} className='btn btn-info m-1'>Search</Button>
                     </div>
                     
@@ -1,41 +1,429 @@
+import html
+import logging
+import math
 import os
+import re
 import sys
+import threading
+import time
 
-from rapidfuzz import fuzz
-from typing import DefaultDict, List, Set, Dict
-import pickle
-from collections import Counter, defaultdict
+from rapidfuzz import fuzz, process
+from typing import List, Optional, Set, Dict, Tuple
+from array import array
+from collections import Counter, OrderedDict, defaultdict
 from heapq import *
+from operator import itemgetter
 
 sys.path.extend([os.getcwd()])
 
 from models import *
+from indexing.tokenization import get_tokenizer
+from storage.index_file import SUGGEST_TOP, DocInfo, IndexReader, trigrams
+from storage.ranks import read_ranks
+from storage.segments import MANIFEST_NAME, SegmentManifest
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+PHRASE_RE = re.compile(r'"([^"]+)"')
+WORD_RE = re.compile(r"\w+")
+
+logger: logging.Logger = logging.getLogger("Search")
+
+
+class QueryCache:
+    # LRU of search results; entries also expire after `ttl` seconds
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size: int = size
+        self.ttl: float = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups: int = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class Snapshot:
+    # Segments of one manifest generation; replaced as a whole on reload
+    def __init__(self, manifest: SegmentManifest) -> None:
+        self.generation: int = manifest.generation
+        self.names: List[str] = list(manifest.segments)
+
+        # Memory mapped: pages are read on demand and shared between processes
+        self.segments: List[IndexReader] = [IndexReader(path) for path in manifest.paths()]
+        self.n_docs: int = sum(segment.n_docs for segment in self.segments)
+        self.avg_length: float = sum(
+            segment.avg_length * segment.n_docs for segment in self.segments
+        ) / max(self.n_docs, 1)
+
+        # Link authority per doc id, when the analysis stage has run
+        self.authority: List[Optional[array]] = []
+        for path, segment in zip(manifest.paths(), self.segments):
+            ranks = read_ranks(path, segment.n_docs)
+            self.authority.append(ranks[0] if ranks is not None else None)
+
+        # Boosting only some segments would rank them unevenly against the rest
+        self.ranked: bool = bool(self.segments) and all(
+            authority is not None for authority in self.authority
+        )
+        if not self.ranked and any(authority is not None for authority in self.authority):
+            logger.warning(
+                "Link ranking off: %d of %d segments have no ranks (run python analysis)",
+                self.authority.count(None),
+                len(self.segments),
+            )
+
+
+def make_snippet(text: str, words: List[str], length: int) -> str:
+    # Escaped html, with words of the query (and their longer forms) in <mark>
+    pattern = None
+    if words:
+        pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(word) for word in words) + r")\w*", re.IGNORECASE
+        )
+    matches = list(pattern.finditer(text)) if pattern else []
+
+    # Window holding the most matches, starting a little before the first of them
+    start = 0
+    if matches:
+        best = count = j = 0
+        for i, match in enumerate(matches):
+            while matches[j].start() < match.start() - length // 2:
+                j += 1
+            if i - j + 1 > count:
+                best, count = j, i - j + 1
+        start = max(matches[best].start() - length // 4, 0)
+        space: int = text.find(" ", start, matches[best].start())
+        if start and space != -1:
+            start = space + 1
+
+    # Cut at word boundaries where possible
+    end: int = min(start + length, len(text))
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        if space > start:
+            end = space
+
+    parts: List[str] = ["... " if start else ""]
+    position = start
+    for match in matches:
+        if match.start() < start:
+            continue
+        if match.end() > end:
+            break
+        parts.append(html.escape(text[position : match.start()]))
+        parts.append("<mark>" + html.escape(match.group()) + "</mark>")
+        position = match.end()
+    parts.append(html.escape(text[position:end]))
+    parts.append(" ..." if end < len(text) else "")
+    return "".join(parts)
+
+
+def phrase_matches(segment: IndexReader, words: List[Tuple[int, str]]) -> Dict[int, int]:
+    # Doc id -> occurrences of the phrase. Postings are intersected rarest term
+    # first with skip pointers, then positions are checked on the common docs.
+    if not segment.positional:
+        return {}
+
+    cursors = []
+    for position, word in words:
+        term_id: Optional[int] = segment.find(word)
+        if term_id is None:
+            return {}
+        cursors.append((segment.doc_freqs[term_id], position - words[0][0], segment.cursor(term_id)))
+    cursors.sort(key=itemgetter(0, 1))
+
+    matches: Dict[int, int] = {}
+    lead = cursors[0][2]
+    doc: Optional[int] = lead.advance(0)
+    while doc is not None:
+        target: int = doc
+        for _, _, cursor in cursors[1:]:
+            found: Optional[int] = cursor.advance(target)
+            if found is None:
+                return matches
+            if found != target:
+                target = found
+                break
+
+        if target != doc:
+            doc = lead.advance(target)
+            continue
+
+        # Phrase start positions shared by every term
+        starts: Optional[Set[int]] = None
+        for _, offset, cursor in cursors:
+            shifted: Set[int] = {position - offset for position in cursor.positions()}
+            starts = shifted if starts is None else starts & shifted
+            if not starts:
+                break
+
+        if starts:
+            matches[doc] = len(starts)
+        doc = lead.advance(doc + 1)
+
+    return matches
+
 
 class Search:
     def __init__(self, crawlopts: CrawlConfig):
         self.crawlopts = crawlopts
-        self.bigram_map: DefaultDict[str, Set[str]]
-        self.keys: Set[str] = set()
+        self.tokenizer = get_tokenizer(crawlopts.tokenizer)
+        if crawlopts.positions:
+            self.tokenizer.setup()
+        self.cache: QueryCache = QueryCache(crawlopts.query_cache, crawlopts.query_cache_ttl)
+        self.snapshot: Snapshot
+        self.manifest_mtime: int = 0
+        self.reloads: int = 0
+        self.last_reload: float = 0
 
         self.load()
 
+    def manifest_path(self) -> str:
+        return os.path.join(self.crawlopts.index, MANIFEST_NAME)
+
     def load(self):
-        with open(self.crawlopts.index, "rb") as index:
-            self.bigram_map: DefaultDict[str, Set[str]] = pickle.load(index)
+        path: str = self.manifest_path()
+        self.manifest_mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+        self.snapshot = Snapshot(SegmentManifest.load(self.crawlopts.index))
+        self.last_reload = time.time()
+
+    def reload(self) -> bool:
+        path: str = self.manifest_path()
+        if not os.path.exists(path) or os.stat(path).st_mtime_ns == self.manifest_mtime:
+            return False
+
+        # Build the new snapshot first; searches keep using the old one until the swap.
+        # Old readers are not closed: running queries may hold them, and their maps
+        # stay valid after merges delete the files.
+        manifest = SegmentManifest.load(self.crawlopts.index)
+        if manifest.generation == self.snapshot.generation:
+            self.manifest_mtime = os.stat(path).st_mtime_ns
+            return False
+
+        previous: int = self.snapshot.generation
+        self.load()
+        self.cache.clear()
+        self.reloads += 1
+
+        logger.info(
+            "Reloaded index: generation %d -> %d (%d segments, %d documents)",
+            previous,
+            self.snapshot.generation,
+            len(self.snapshot.segments),
+            self.snapshot.n_docs,
+        )
+        return True
+
+    def watch(self, interval: float) -> threading.Thread:
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as err:
+                    logger.error("Index reload failed: %s", err)
+
+        thread = threading.Thread(target=poll, name="IndexWatcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "cache": self.cache.stats(),
+            "reloads": self.reloads,
+            "last_reload": self.last_reload,
+            "generation": self.snapshot.generation,
+            "segments": len(self.snapshot.segments),
+            "documents": self.snapshot.n_docs,
+        }
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_TOP) -> List[Tuple[str, int]]:
+        # Document frequencies are summed over the segments a term appears in
+        counts = Counter()
+        for segment in self.snapshot.segments:
+            for term, df in segment.suggest(prefix, limit):
+                counts[term] += df
+        return counts.most_common(limit)
+
+    def candidates(self, query: str, snapshot: Snapshot) -> List[str]:
+        grams: Set[str] = trigrams(query)
+        for token in query.split():
+            grams |= trigrams(token)
+
+        # Terms sharing the most trigrams with the query (in any segment)
+        best: Dict[str, int] = {}
+        for segment in snapshot.segments:
+            overlap = Counter()
+            for gram in grams:
+                overlap.update(segment.gram_terms(gram))
+
+            for term_id, count in overlap.most_common(self.crawlopts.fuzzy_candidates):
+                term: str = segment.term(term_id)
+                best[term] = max(best.get(term, 0), count)
+
+        return nlargest(self.crawlopts.fuzzy_candidates, best, key=best.__getitem__)
+
+    def search(
+        self, query: str, limit: int = 10, offset: int = 0, score_len=10
+    ) -> List[Tuple[str, float, Optional[DocInfo], Optional[str]]]:
+        key = (query, limit, offset, score_len)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Pinned for the whole query, so a reload cannot mix generations
+        snapshot: Snapshot = self.snapshot
+
+        phrases: List[str] = PHRASE_RE.findall(query)
+        if phrases:
+            scores = self.phrase_scores(snapshot, phrases, PHRASE_RE.sub(" ", query))
+        else:
+            scores = self.fuzzy_scores(snapshot, query, score_len)
+
+        # Relevance scaled by link authority: one array lookup per scored document
+        if self.crawlopts.rank_weight and snapshot.ranked:
+            for (i, doc_id), score in scores.items():
+                scores[i, doc_id] = score * (
+                    1 + self.crawlopts.rank_weight * snapshot.authority[i][doc_id]
+                )
+
+        top_docs = nlargest(offset + limit, scores.items(), key=itemgetter(1))[offset:]
+
+        # Metadata and text come from the segment stores when they have them.
+        # Only the returned page is decompressed (at most snippet_text characters each).
+        words: List[str] = [word for word in WORD_RE.findall(query) if len(word) > 1]
+        results = []
+        for (i, doc_id), score in top_docs:
+            segment: IndexReader = snapshot.segments[i]
+            text: Optional[str] = segment.doc_text(doc_id)
+            snippet: Optional[str] = None
+            if text is not None:
+                snippet = make_snippet(text, words, self.crawlopts.snippet_length)
+            results.append((segment.doc_hash(doc_id), score, segment.doc_info(doc_id), snippet))
+
+        # Not cached if the index was swapped while this query ran
+        if snapshot is self.snapshot:
+            self.cache.put(key, results)
+        return results
+
+    @staticmethod
+    def idf(snapshot: Snapshot, df: int) -> float:
+        return math.log(1 + (snapshot.n_docs - df + 0.5) / (df + 0.5))
+
+    @staticmethod
+    def bm25(snapshot: Snapshot, segment: IndexReader, doc_id: int, tf: int) -> float:
+        norm = K1 * (1 - B + B * segment.doc_lengths[doc_id] / snapshot.avg_length)
+        return tf * (K1 + 1) / (tf + norm)
+
+    def phrase_scores(
+        self, snapshot: Snapshot, phrases: List[str], rest: str
+    ) -> Dict[Tuple[int, int], float]:
+        # Exact matching only: every phrase must occur, unquoted words add to the score
+        scores: Optional[Dict[Tuple[int, int], float]] = None
+        for phrase in phrases:
+            words: List[Tuple[int, str]] = self.tokenizer.words(phrase)
+            if not words:
+                continue
+
+            hits: Dict[Tuple[int, int], int] = {}
+            for i, segment in enumerate(snapshot.segments):
+                for doc_id, count in phrase_matches(segment, words).items():
+                    hits[i, doc_id] = count
+
+            idf: float = Search.idf(snapshot, len(hits))
+            phrase: Dict[Tuple[int, int], float] = {
+                (i, doc_id): idf * Search.bm25(snapshot, snapshot.segments[i], doc_id, count)
+                for (i, doc_id), count in hits.items()
+            }
+            if scores is None:
+                scores = phrase
+            else:
+                scores = {doc: score + phrase[doc] for doc, score in scores.items() if doc in phrase}
+
+        if not scores:
+            return {}
+
+        for _, word in self.tokenizer.words(rest):
+            matches: List[Tuple[int, int]] = []
+            for i, segment in enumerate(snapshot.segments):
+                term_id: Optional[int] = segment.find(word)
+                if term_id is not None:
+                    matches.append((i, term_id))
+
+            df: int = sum(snapshot.segments[i].doc_freqs[term_id] for i, term_id in matches)
+            idf = Search.idf(snapshot, df)
+            for i, term_id in matches:
+                segment: IndexReader = snapshot.segments[i]
+                for doc_id, tf in zip(*segment.postings(term_id)):
+                    if (i, doc_id) in scores:
+                        scores[i, doc_id] += idf * Search.bm25(snapshot, segment, doc_id, tf)
+
+        return scores
 
-        self.keys.update(self.bigram_map.keys())
+    def fuzzy_scores(
+        self, snapshot: Snapshot, query: str, score_len: int
+    ) -> Dict[Tuple[int, int], float]:
+        top_keys = process.extract(
+            query,
+            self.candidates(query, snapshot),
+            scorer=fuzz.token_set_ratio,
+            limit=score_len,
+        )
 
-    def search(self, query: str, score_len=10):
-        scores = []
+        # BM25 over the matched terms, weighted by how well each term matched
+        scores: Dict[Tuple[int, int], float] = defaultdict(float)
+        for term, similarity, _ in top_keys:
+            matches: List[Tuple[int, int]] = []
+            for i, segment in enumerate(snapshot.segments):
+                term_id: Optional[int] = segment.find(term)
+                if term_id is not None:
+                    matches.append((i, term_id))
 
-        for key in self.keys:
-            score = 100 - fuzz.token_set_ratio(query, key)
-            heappush(scores, [score, self.bigram_map[key]])
+            df: int = sum(snapshot.segments[i].doc_freqs[term_id] for i, term_id in matches)
+            weight: float = similarity / 100 * Search.idf(snapshot, df)
 
-        top_keys = [heappop(scores) for _ in range(score_len)]
-        hash_counter = Counter()
-        for score, hashes in top_keys:
-            hash_counter.update(hashes)
+            for i, term_id in matches:
+                segment: IndexReader = snapshot.segments[i]
+                for doc_id, tf in zip(*segment.postings(term_id)):
+                    scores[i, doc_id] += weight * Search.bm25(snapshot, segment, doc_id, tf)
 
-        return [el for el, _ in hash_counter.most_common()]
+        return scores
 
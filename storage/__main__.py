@@ -0,0 +1,75 @@
+import argparse
+import logging
+import os
+import re
+import sys
+from packfile import PackStore
+
+sys.path.extend([os.getcwd()])
+from models import *
+
+HASH_RE = re.compile(r"^[0-9a-f]{40}$")
+
+
+def migrate(crawlopts: CrawlConfig, remove: bool):
+    store = PackStore(crawlopts.cache_dir, crawlopts.pack_size)
+    names = sorted(
+        name for name in os.listdir(crawlopts.cache_dir) if HASH_RE.match(name)
+    )
+
+    logging.info("Migrating %d cached pages into packfiles", len(names))
+    added = 0
+    for name in names:
+        path = os.path.join(crawlopts.cache_dir, name)
+        with open(path, "rb") as fd:
+            if store.put(name, fd.read()):
+                added += 1
+
+        if remove:
+            os.remove(path)
+
+    store.close()
+    logging.info("Migrated %d pages (%d already packed)", added, len(names) - added)
+    print(f"Migrated {added} of {len(names)} cached pages")
+
+
+def stats(crawlopts: CrawlConfig):
+    store = PackStore(crawlopts.cache_dir, crawlopts.pack_size)
+    print(f"{len(store)} pages, {store.size() / 1e6:.2f} MB in {crawlopts.cache_dir}")
+    store.close()
+
+
+def main(args):
+    crawlopts = CrawlConfig.load_config(args.config, make_dirs=False)
+
+    logging.basicConfig(
+        filename=crawlopts.log_file,
+        level=logging.DEBUG if crawlopts.debug else logging.INFO,
+        force=True,
+        format=LOGGING_FORMAT,
+    )
+
+    if args.migrate:
+        migrate(crawlopts, args.remove)
+
+    stats(crawlopts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-config", help="Path to the config file", required=True)
+    parser.add_argument(
+        "-migrate",
+        help="Move loose cache files into packfiles",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "-remove",
+        help="Delete loose cache files once packed",
+        required=False,
+        action="store_true",
+    )
+
+    args = parser.parse_args()
+    main(args)
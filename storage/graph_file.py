@@ -0,0 +1,150 @@
+import struct
+from array import array
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+import ujson as json
+
+# Binary edge list: header, node records, then the source and target id arrays.
+# Node record: u32 url length, url, u32 title length (NO_TITLE if absent), title
+MAGIC = b"WCGRAPH\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIQQ")  # magic, version, nodes, edges
+LENGTH = struct.Struct("<I")
+NO_TITLE = 0xFFFFFFFF
+
+# Nodes or edges serialized per write
+CHUNK_SIZE = 10000
+
+# graph_format -> file extension of saved graphs
+EXTENSIONS = {"json": ".json", "binary": ".graph"}
+
+
+class LinkGraph:
+    # Urls are interned to integer ids; edges are two parallel u32 arrays
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.urls: List[str] = []
+        self.titles: List[Optional[str]] = []
+        self.sources: array = array("I")
+        self.targets: array = array("I")
+
+    def intern(self, url: str) -> int:
+        node: Optional[int] = self.ids.get(url)
+        if node is None:
+            node = self.ids[url] = len(self.urls)
+            self.urls.append(url)
+            self.titles.append(None)
+        return node
+
+    def add_edges(self, source: int, targets: Iterable[int]):
+        for target in targets:
+            self.sources.append(source)
+            self.targets.append(target)
+
+    def copy(self) -> "LinkGraph":
+        graph = LinkGraph()
+        graph.ids = dict(self.ids)
+        graph.urls = list(self.urls)
+        graph.titles = list(self.titles)
+        graph.sources = array("I", self.sources)
+        graph.targets = array("I", self.targets)
+        return graph
+
+    def n_nodes(self) -> int:
+        return len(self.urls)
+
+    def n_edges(self) -> int:
+        return len(self.sources)
+
+    def cytoscape_chunks(self) -> Iterator[str]:
+        # Same document as networkx.cytoscape_data, written piece by piece.
+        # Sizes are fixed up front, so nodes added meanwhile are left out.
+        n_nodes, n_edges = self.n_nodes(), self.n_edges()
+
+        yield '{"data":[],"directed":true,"multigraph":false,"elements":{"nodes":['
+        for start in range(0, n_nodes, CHUNK_SIZE):
+            nodes: List[str] = []
+            for node in range(start, min(start + CHUNK_SIZE, n_nodes)):
+                url: str = self.urls[node]
+                data = {"id": url, "value": url, "name": url}
+                if self.titles[node] is not None:
+                    data["description"] = self.titles[node]
+                nodes.append(json.dumps({"data": data}))
+            yield ("," if start else "") + ",".join(nodes)
+
+        yield '],"edges":['
+        for start in range(0, n_edges, CHUNK_SIZE):
+            end: int = min(start + CHUNK_SIZE, n_edges)
+            edges: List[str] = [
+                json.dumps({"data": {"source": self.urls[source], "target": self.urls[target]}})
+                for source, target in zip(self.sources[start:end], self.targets[start:end])
+            ]
+            yield ("," if start else "") + ",".join(edges)
+        yield "]}}"
+
+    def binary_chunks(self) -> Iterator[bytes]:
+        n_nodes, n_edges = self.n_nodes(), self.n_edges()
+        yield HEADER.pack(MAGIC, VERSION, n_nodes, n_edges)
+
+        for start in range(0, n_nodes, CHUNK_SIZE):
+            records: bytearray = bytearray()
+            for node in range(start, min(start + CHUNK_SIZE, n_nodes)):
+                url: bytes = self.urls[node].encode()
+                records += LENGTH.pack(len(url))
+                records += url
+
+                title: Optional[str] = self.titles[node]
+                if title is None:
+                    records += LENGTH.pack(NO_TITLE)
+                else:
+                    encoded: bytes = title.encode()
+                    records += LENGTH.pack(len(encoded))
+                    records += encoded
+            yield bytes(records)
+
+        yield self.sources[:n_edges].tobytes()
+        yield self.targets[:n_edges].tobytes()
+
+    @staticmethod
+    def read_binary(fd: BinaryIO) -> "LinkGraph":
+        magic, version, n_nodes, n_edges = HEADER.unpack(fd.read(HEADER.size))
+        if version != VERSION:
+            raise ValueError(f"Unsupported graph version {version}")
+
+        graph = LinkGraph()
+        for _ in range(n_nodes):
+            (length,) = LENGTH.unpack(fd.read(LENGTH.size))
+            node: int = graph.intern(fd.read(length).decode())
+
+            (length,) = LENGTH.unpack(fd.read(LENGTH.size))
+            if length != NO_TITLE:
+                graph.titles[node] = fd.read(length).decode()
+
+        graph.sources.frombytes(fd.read(n_edges * graph.sources.itemsize))
+        graph.targets.frombytes(fd.read(n_edges * graph.targets.itemsize))
+        return graph
+
+    @staticmethod
+    def read_cytoscape(fd) -> "LinkGraph":
+        data = json.load(fd)
+
+        graph = LinkGraph()
+        for node in data["elements"]["nodes"]:
+            node_id: int = graph.intern(node["data"]["id"])
+            graph.titles[node_id] = node["data"].get("description")
+
+        for edge in data["elements"]["edges"]:
+            graph.sources.append(graph.intern(edge["data"]["source"]))
+            graph.targets.append(graph.intern(edge["data"]["target"]))
+        return graph
+
+    @staticmethod
+    def load(path: str) -> "LinkGraph":
+        # Either format, told apart by the magic
+        with open(path, "rb") as fd:
+            if fd.read(len(MAGIC)) == MAGIC:
+                fd.seek(0)
+                return LinkGraph.read_binary(fd)
+
+        with open(path) as fd:
+            return LinkGraph.read_cytoscape(fd)
@@ -0,0 +1,215 @@
+import os
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import ujson as json
+
+from storage.graph_file import EXTENSIONS, LinkGraph
+
+# Per profile: full graphs ("bases") every few snapshots and a delta for every
+# snapshot after the first. Deltas form an unbroken chain, so diffs between
+# any two snapshots only read the deltas in between.
+CHAIN_NAME = "chain.json"
+
+Edge = Tuple[str, str]
+
+
+class GraphDiff(NamedTuple):
+    added_pages: Set[str]
+    removed_pages: Set[str]
+    added_links: Set[Edge]
+    removed_links: Set[Edge]
+
+
+class GraphState:
+    # Nodes and edges keyed by url, for applying and computing deltas
+    def __init__(self) -> None:
+        self.titles: Dict[str, Optional[str]] = {}
+        self.edges: Set[Edge] = set()
+
+    @staticmethod
+    def from_graph(graph: LinkGraph) -> "GraphState":
+        state = GraphState()
+        state.titles = dict(zip(graph.urls, graph.titles))
+        urls: List[str] = graph.urls
+        state.edges = {(urls[s], urls[t]) for s, t in zip(graph.sources, graph.targets)}
+        return state
+
+    def to_graph(self) -> LinkGraph:
+        graph = LinkGraph()
+        for url, title in self.titles.items():
+            graph.titles[graph.intern(url)] = title
+        for source, target in self.edges:
+            graph.sources.append(graph.intern(source))
+            graph.targets.append(graph.intern(target))
+        return graph
+
+    def apply(self, delta: dict):
+        for url in delta["remove_nodes"]:
+            self.titles.pop(url, None)
+        self.titles.update(delta["add_nodes"])
+        self.titles.update(delta["titles"])
+        self.edges.difference_update(map(tuple, delta["remove_edges"]))
+        self.edges.update(map(tuple, delta["add_edges"]))
+
+
+def make_delta(old: GraphState, new: GraphState) -> dict:
+    return {
+        "add_nodes": {url: title for url, title in new.titles.items() if url not in old.titles},
+        "titles": {
+            url: title
+            for url, title in new.titles.items()
+            if url in old.titles and old.titles[url] != title
+        },
+        "remove_nodes": [url for url in old.titles if url not in new.titles],
+        "add_edges": list(new.edges - old.edges),
+        "remove_edges": list(old.edges - new.edges),
+    }
+
+
+class SnapshotStore:
+    def __init__(self, graph_dir: str, profile_name: str, rebase: int = 10) -> None:
+        self.root: str = os.path.join(graph_dir, "snapshots", profile_name)
+        self.rebase: int = rebase
+        self.chain: List[dict] = []
+
+        path: str = os.path.join(self.root, CHAIN_NAME)
+        if os.path.exists(path):
+            with open(path) as fd:
+                self.chain = json.load(fd)["snapshots"]
+
+    def timestamps(self) -> List[str]:
+        return [entry["timestamp"] for entry in self.chain]
+
+    def position(self, timestamp: str) -> int:
+        for i, entry in enumerate(self.chain):
+            if entry["timestamp"] == timestamp:
+                return i
+        raise KeyError(f"No snapshot at {timestamp} in {self.root}")
+
+    def read_delta(self, i: int) -> dict:
+        with open(os.path.join(self.root, self.chain[i]["delta"]), "rb") as fd:
+            return json.loads(zlib.decompress(fd.read()).decode())
+
+    def state(self, i: int) -> GraphState:
+        # Nearest base at or before i, then the deltas after it
+        base: int = max(j for j in range(i + 1) if self.chain[j]["base"])
+        state = GraphState.from_graph(LinkGraph.load(os.path.join(self.root, self.chain[base]["base"])))
+        for j in range(base + 1, i + 1):
+            state.apply(self.read_delta(j))
+        return state
+
+    def load(self, timestamp: str) -> LinkGraph:
+        return self.state(self.position(timestamp)).to_graph()
+
+    def add(self, timestamp: str, graph: LinkGraph):
+        os.makedirs(self.root, exist_ok=True)
+        entry = {"timestamp": timestamp, "base": None, "delta": None}
+        new: GraphState = GraphState.from_graph(graph)
+
+        if self.chain:
+            delta: dict = make_delta(self.state(len(self.chain) - 1), new)
+            entry["delta"] = f"delta-{len(self.chain):06d}.delta"
+            with open(os.path.join(self.root, entry["delta"]), "wb") as fd:
+                fd.write(zlib.compress(json.dumps(delta).encode()))
+
+        # A new base every `rebase` snapshots bounds the deltas replayed on load
+        since_base: int = len(self.chain) - max(
+            (i for i, item in enumerate(self.chain) if item["base"]), default=-1
+        )
+        if not self.chain or since_base >= self.rebase:
+            entry["base"] = f"base-{len(self.chain):06d}.graph"
+            with open(os.path.join(self.root, entry["base"]), "wb") as fd:
+                for chunk in graph.binary_chunks():
+                    fd.write(chunk)
+
+        self.chain.append(entry)
+        path: str = os.path.join(self.root, CHAIN_NAME)
+        with open(path + ".tmp", "w") as fd:
+            json.dump({"snapshots": self.chain}, fd)
+        os.replace(path + ".tmp", path)
+
+    def diff(self, a: str, b: str) -> GraphDiff:
+        # Composes the deltas between a and b; neither graph is rebuilt
+        start, end = self.position(a), self.position(b)
+        if start > end:
+            forward = self.diff(b, a)
+            return GraphDiff(
+                forward.removed_pages, forward.added_pages, forward.removed_links, forward.added_links
+            )
+
+        result = GraphDiff(set(), set(), set(), set())
+        for i in range(start + 1, end + 1):
+            delta: dict = self.read_delta(i)
+            compose(
+                result.added_pages, result.removed_pages, delta["add_nodes"], delta["remove_nodes"]
+            )
+            compose(
+                result.added_links,
+                result.removed_links,
+                map(tuple, delta["add_edges"]),
+                map(tuple, delta["remove_edges"]),
+            )
+        return result
+
+
+def compose(added: set, removed: set, add, remove):
+    # An addition undoes an earlier removal and vice versa
+    for item in remove:
+        if item in added:
+            added.discard(item)
+        else:
+            removed.add(item)
+    for item in add:
+        if item in removed:
+            removed.discard(item)
+        else:
+            added.add(item)
+
+
+def graph_timestamps(graph_dir: str, profile_name: str) -> List[str]:
+    # Crawls with a full graph file or a snapshot, oldest first
+    timestamps: Set[str] = set(SnapshotStore(graph_dir, profile_name).timestamps())
+    for folder in os.listdir(graph_dir) if os.path.isdir(graph_dir) else []:
+        for extension in EXTENSIONS.values():
+            if os.path.exists(os.path.join(graph_dir, folder, profile_name + extension)):
+                timestamps.add(folder)
+    return sorted(timestamps)
+
+
+def crawl_graphs(graph_dir: str) -> Dict[str, List[str]]:
+    # Timestamp -> graphs of that crawl: full graph files, and TIMESTAMP/PROFILE
+    # for snapshots (their timestamp folder is left empty)
+    crawls: Dict[str, List[str]] = {}
+    for folder in os.listdir(graph_dir) if os.path.isdir(graph_dir) else []:
+        path: str = os.path.join(graph_dir, folder)
+        if folder == "snapshots" or not os.path.isdir(path):
+            continue
+        crawls.setdefault(folder, []).extend(
+            os.path.join(path, name) for name in sorted(os.listdir(path))
+        )
+
+    snapshot_root: str = os.path.join(graph_dir, "snapshots")
+    for profile in sorted(os.listdir(snapshot_root)) if os.path.isdir(snapshot_root) else []:
+        for timestamp in SnapshotStore(graph_dir, profile).timestamps():
+            crawls.setdefault(timestamp, []).append(f"{timestamp}/{profile}")
+    return crawls
+
+
+def load_graph(graph_dir: str, profile_name: str, timestamp: str) -> LinkGraph:
+    for extension in EXTENSIONS.values():
+        path: str = os.path.join(graph_dir, timestamp, profile_name + extension)
+        if os.path.exists(path):
+            return LinkGraph.load(path)
+    return SnapshotStore(graph_dir, profile_name).load(timestamp)
+
+
+def diff_graphs(old: LinkGraph, new: LinkGraph) -> GraphDiff:
+    # For full graph files outside a snapshot chain
+    old_state, new_state = GraphState.from_graph(old), GraphState.from_graph(new)
+    return GraphDiff(
+        set(new_state.titles) - set(old_state.titles),
+        set(old_state.titles) - set(new_state.titles),
+        new_state.edges - old_state.edges,
+        old_state.edges - new_state.edges,
+    )
@@ -0,0 +1,727 @@
+import heapq
+import mmap
+from bisect import bisect_left
+import os
+import shutil
+import struct
+import zlib
+from array import array
+from collections import defaultdict
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+# Layout: header, section directory, then the sections back to back.
+# Arrays are stored in native (little endian) byte order.
+MAGIC = b"WCINDEX\0"
+VERSION = 3
+HEADER = struct.Struct("<8sII")  # magic, version, number of sections
+SECTION = struct.Struct("<8sQQ")  # name, offset, length
+
+# Sections
+DOCS = b"docs"  # doc id -> raw sha1 (20 bytes each)
+DOC_LENGTHS = b"doclen"  # u32 tokens per document
+TOTAL_LENGTH = b"totlen"  # u64 sum of DOC_LENGTHS (older segments sum on open)
+TERM_OFFSETS = b"termoffs"  # u64 offsets into TERMS (n_terms + 1)
+TERMS = b"terms"  # sorted utf-8 terms, concatenated
+POSTING_OFFSETS = b"postoffs"  # u64 offsets into POSTINGS (n_terms + 1)
+POSTINGS = b"postings"  # varint (doc id delta, term frequency) pairs per term
+DOC_FREQS = b"df"  # u32 document frequency per term
+GRAM_OFFSETS = b"gramoffs"  # u64 offsets into GRAMS (n_grams + 1)
+GRAMS = b"grams"  # sorted character trigrams of all terms
+GRAM_POSTING_OFFSETS = b"gpostoff"  # u64 offsets into GRAM_POSTINGS
+GRAM_POSTINGS = b"gpost"  # varint delta encoded term ids per trigram
+
+# Optional doc store, used to hydrate results without the crawl databases
+DOC_TIMES = b"doctime"  # i64 crawl time per document
+DOC_META_OFFSETS = b"metaoffs"  # u64 offsets into DOC_META (n_docs + 1)
+DOC_META = b"docmeta"  # utf-8 url, profile and title per document, NUL separated
+
+# Optional typeahead table: most frequent terms for every prefix shared by
+# more than SUGGEST_SCAN terms; any other prefix matches few enough terms to scan
+PREFIX_OFFSETS = b"sgpoffs"  # u64 offsets into PREFIXES (n_prefixes + 1)
+PREFIXES = b"sgprefix"  # sorted term prefixes
+SUGGEST_OFFSETS = b"sgoffs"  # u64 offsets into SUGGEST
+SUGGEST = b"sgtop"  # varint term ids per prefix, most frequent first
+
+SUGGEST_TOP = 10
+SUGGEST_SCAN = 64
+
+# Segments written before the table (until merged): scan cap, results may be partial
+LEGACY_SUGGEST_SCAN = 20000
+
+# Optional positional index (phrase queries)
+POSITION_OFFSETS = b"posoffs"  # u64 offsets into POSITIONS (n_terms + 1)
+POSITIONS = b"position"  # per posting: varint count, then delta encoded positions
+SKIP_OFFSETS = b"skipoffs"  # u64 offsets into SKIPS, in entries (n_terms + 1)
+SKIPS = b"skips"  # u64 (doc id before the block, postings offset, positions offset)
+
+SKIP_INTERVAL = 128
+
+# Optional text store (result snippets)
+DOC_TEXT_OFFSETS = b"textoffs"  # u64 offsets into DOC_TEXT (n_docs + 1)
+DOC_TEXT = b"doctext"  # zlib compressed extracted text per document
+
+HASH_SIZE = 20
+
+# url, time, profile, title
+DocInfo = Tuple[str, int, str, str]
+
+
+def trigrams(term: str) -> Set[str]:
+    padded: str = f" {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def encode_varints(values: Iterable[int], out: bytearray) -> bytearray:
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return out
+
+
+def decode_varints(buf: memoryview, start: int, end: int) -> List[int]:
+    values: List[int] = []
+    value = shift = 0
+    for byte in buf[start:end]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+def encode_postings(doc_ids: Sequence[int], freqs: Sequence[int]) -> bytearray:
+    previous = 0
+    values: List[int] = []
+    for doc_id, freq in zip(doc_ids, freqs):
+        values.append(doc_id - previous)
+        values.append(freq)
+        previous = doc_id
+    return encode_varints(values, bytearray())
+
+
+def decode_postings(values: List[int]) -> Tuple[List[int], List[int]]:
+    doc_ids: List[int] = delta_decode(values[0::2])
+    return doc_ids, values[1::2]
+
+
+def encode_positions(positions: Iterable[Sequence[int]], out: bytearray) -> bytearray:
+    for doc_positions in positions:
+        encode_varints((len(doc_positions),), out)
+        out += delta_encode(doc_positions)
+    return out
+
+
+def decode_positions(values: List[int]) -> List[List[int]]:
+    positions: List[List[int]] = []
+    i = 0
+    while i < len(values):
+        count: int = values[i]
+        positions.append(delta_decode(values[i + 1 : i + 1 + count]))
+        i += 1 + count
+    return positions
+
+
+def encode_positional(
+    doc_ids: Sequence[int], freqs: Sequence[int], positions: Sequence[Sequence[int]]
+) -> Tuple[bytearray, bytearray, List[int]]:
+    # Same postings encoding as encode_postings, plus a skip entry every SKIP_INTERVAL
+    postings: bytearray = bytearray()
+    data: bytearray = bytearray()
+    skips: List[int] = []
+
+    previous = 0
+    for i, (doc_id, freq, doc_positions) in enumerate(zip(doc_ids, freqs, positions)):
+        if i % SKIP_INTERVAL == 0:
+            skips += (previous, len(postings), len(data))
+
+        encode_varints((doc_id - previous, freq), postings)
+        encode_positions((doc_positions,), data)
+        previous = doc_id
+
+    return postings, data, skips
+
+
+def delta_encode(doc_ids: Sequence[int]) -> bytearray:
+    previous = 0
+    deltas: List[int] = []
+    for doc_id in doc_ids:
+        deltas.append(doc_id - previous)
+        previous = doc_id
+    return encode_varints(deltas, bytearray())
+
+
+def delta_decode(values: List[int]) -> List[int]:
+    total = 0
+    for i, value in enumerate(values):
+        total += value
+        values[i] = total
+    return values
+
+
+class IndexWriter:
+    # Terms must be added in sorted order; postings are spooled to disk
+    def __init__(self, path: str, positional: bool = False, texts: bool = False) -> None:
+        self.path: str = path
+        self.positional: bool = positional
+        self.texts: bool = texts
+        self.docs: bytearray = bytearray()
+        self.doc_lengths: array = array("I")
+        self.total_length: int = 0
+        self.doc_times: array = array("q")
+        self.doc_meta_offsets: array = array("Q", [0])
+        self.doc_meta: bytearray = bytearray()
+
+        self.terms_fd: BinaryIO = open(path + ".terms.tmp", "wb+")
+        self.postings_fd: BinaryIO = open(path + ".postings.tmp", "wb+")
+
+        self.term_offsets: array = array("Q", [0])
+        self.posting_offsets: array = array("Q", [0])
+        self.doc_freqs: array = array("I")
+        self.last_term: Optional[bytes] = None
+
+        self.positions_fd: Optional[BinaryIO] = None
+        self.position_offsets: array = array("Q", [0])
+        self.skip_offsets: array = array("Q", [0])
+        self.skips: array = array("Q")
+        if positional:
+            self.positions_fd = open(path + ".positions.tmp", "wb+")
+
+        # Trigram -> term ids (fuzzy candidate generation)
+        self.grams: Dict[str, array] = defaultdict(lambda: array("I"))
+
+        # Prefixes of the previous term: [length, terms, min-heap of (df, term id)].
+        # Terms arrive sorted, so a prefix is complete once the next term leaves it.
+        self.prefix_stack: List[list] = []
+        self.prefix_term: str = ""
+        self.prefixes: Dict[str, List[Tuple[int, int]]] = {}
+
+        self.text_fd: Optional[BinaryIO] = None
+        self.text_offsets: array = array("Q", [0])
+        if texts:
+            self.text_fd = open(path + ".text.tmp", "wb+")
+
+    def add_document(
+        self,
+        hash_str: str,
+        length: int,
+        info: Optional[DocInfo] = None,
+        text: Optional[bytes] = None,
+    ) -> int:
+        self.docs += bytes.fromhex(hash_str)
+        self.doc_lengths.append(length)
+        self.total_length += length
+
+        # Documents without metadata get an empty record
+        if info is not None:
+            url, crawl_time, profile, title = info
+            self.doc_meta += "\0".join((url, profile, title)).encode()
+            self.doc_times.append(crawl_time)
+        else:
+            self.doc_times.append(0)
+        self.doc_meta_offsets.append(len(self.doc_meta))
+
+        # Text arrives zlib compressed; documents without text get an empty record
+        if self.texts:
+            if text:
+                self.text_fd.write(text)
+            self.text_offsets.append(self.text_offsets[-1] + len(text or b""))
+
+        return len(self.doc_lengths) - 1
+
+    def add_term(
+        self,
+        term: str,
+        doc_ids: Sequence[int],
+        freqs: Sequence[int],
+        positions: Optional[Sequence[Sequence[int]]] = None,
+    ):
+        encoded: bytes = term.encode()
+        if self.last_term is not None and encoded <= self.last_term:
+            raise ValueError(f"Terms out of order: {term!r}")
+        self.last_term = encoded
+
+        self.terms_fd.write(encoded)
+        self.term_offsets.append(self.term_offsets[-1] + len(encoded))
+
+        if self.positional:
+            # Terms without positions (bigrams) get empty position lists
+            postings, data, skips = encode_positional(
+                doc_ids, freqs, positions or [()] * len(doc_ids)
+            )
+            self.positions_fd.write(data)
+            self.position_offsets.append(self.position_offsets[-1] + len(data))
+            self.skips.extend(skips)
+            self.skip_offsets.append(len(self.skips) // 3)
+        else:
+            postings = encode_postings(doc_ids, freqs)
+        self.postings_fd.write(postings)
+        self.posting_offsets.append(self.posting_offsets[-1] + len(postings))
+        self.doc_freqs.append(len(doc_ids))
+
+        term_id: int = len(self.doc_freqs) - 1
+        for gram in trigrams(term):
+            self.grams[gram].append(term_id)
+
+        self.add_prefixes(term, len(doc_ids), term_id)
+
+    def add_prefixes(self, term: str, df: int, term_id: int):
+        shared: int = 0
+        for a, b in zip(self.prefix_term, term):
+            if a != b:
+                break
+            shared += 1
+        self.close_prefixes(shared)
+
+        for length in range(len(self.prefix_stack) + 1, len(term) + 1):
+            self.prefix_stack.append([length, 0, []])
+        self.prefix_term = term
+
+        for entry in self.prefix_stack:
+            entry[1] += 1
+            top: List[Tuple[int, int]] = entry[2]
+            if len(top) < SUGGEST_TOP:
+                heapq.heappush(top, (df, term_id))
+            elif df > top[0][0]:
+                heapq.heapreplace(top, (df, term_id))
+
+    def close_prefixes(self, keep: int):
+        # Only prefixes too common to scan are stored
+        while len(self.prefix_stack) > keep:
+            length, count, top = self.prefix_stack.pop()
+            if count > SUGGEST_SCAN:
+                self.prefixes[self.prefix_term[:length]] = top
+
+    def gram_sections(self) -> List[Tuple[bytes, object]]:
+        gram_offsets: array = array("Q", [0])
+        grams: bytearray = bytearray()
+        posting_offsets: array = array("Q", [0])
+        postings: bytearray = bytearray()
+
+        for gram in sorted(self.grams):
+            grams += gram.encode()
+            gram_offsets.append(len(grams))
+            postings += delta_encode(self.grams[gram])
+            posting_offsets.append(len(postings))
+
+        return [
+            (GRAM_OFFSETS, gram_offsets),
+            (GRAMS, grams),
+            (GRAM_POSTING_OFFSETS, posting_offsets),
+            (GRAM_POSTINGS, postings),
+        ]
+
+    def prefix_sections(self) -> List[Tuple[bytes, object]]:
+        prefix_offsets: array = array("Q", [0])
+        prefixes: bytearray = bytearray()
+        suggest_offsets: array = array("Q", [0])
+        suggest: bytearray = bytearray()
+
+        self.close_prefixes(0)
+
+        # Sorted by utf-8 bytes, like the term dictionary
+        for prefix in sorted(self.prefixes, key=str.encode):
+            prefixes += prefix.encode()
+            prefix_offsets.append(len(prefixes))
+            top = sorted(self.prefixes[prefix], key=lambda item: (-item[0], item[1]))
+            encode_varints((term_id for _, term_id in top), suggest)
+            suggest_offsets.append(len(suggest))
+
+        return [
+            (PREFIX_OFFSETS, prefix_offsets),
+            (PREFIXES, prefixes),
+            (SUGGEST_OFFSETS, suggest_offsets),
+            (SUGGEST, suggest),
+        ]
+
+    def position_sections(self) -> List[Tuple[bytes, object]]:
+        if not self.positional:
+            return []
+
+        return [
+            (POSITION_OFFSETS, self.position_offsets),
+            (POSITIONS, self.positions_fd),
+            (SKIP_OFFSETS, self.skip_offsets),
+            (SKIPS, self.skips),
+        ]
+
+    def text_sections(self) -> List[Tuple[bytes, object]]:
+        if not self.texts:
+            return []
+        return [(DOC_TEXT_OFFSETS, self.text_offsets), (DOC_TEXT, self.text_fd)]
+
+    def sections(self) -> List[Tuple[bytes, object]]:
+        # Bytes-like objects or spooled files, in file order
+        return [
+            (DOCS, self.docs),
+            (DOC_LENGTHS, self.doc_lengths),
+            (TOTAL_LENGTH, array("Q", [self.total_length])),
+            (TERM_OFFSETS, self.term_offsets),
+            (TERMS, self.terms_fd),
+            (POSTING_OFFSETS, self.posting_offsets),
+            (POSTINGS, self.postings_fd),
+            (DOC_FREQS, self.doc_freqs),
+            (DOC_TIMES, self.doc_times),
+            (DOC_META_OFFSETS, self.doc_meta_offsets),
+            (DOC_META, self.doc_meta),
+        ] + (
+            self.gram_sections()
+            + self.prefix_sections()
+            + self.position_sections()
+            + self.text_sections()
+        )
+
+    def close(self):
+        sections = self.sections()
+
+        lengths: List[int] = []
+        for _, data in sections:
+            if hasattr(data, "seek"):
+                lengths.append(data.seek(0, os.SEEK_END))
+            else:
+                lengths.append(len(memoryview(data).cast("B")))
+
+        offset: int = HEADER.size + SECTION.size * len(sections)
+        tmp: str = self.path + ".tmp"
+        with open(tmp, "wb") as fd:
+            fd.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+            for (name, _), length in zip(sections, lengths):
+                fd.write(SECTION.pack(name, offset, length))
+                offset += length
+
+            for _, data in sections:
+                if hasattr(data, "seek"):
+                    data.seek(0)
+                    shutil.copyfileobj(data, fd, 1 << 20)
+                else:
+                    fd.write(data)
+
+        for spool in (self.terms_fd, self.postings_fd, self.positions_fd, self.text_fd):
+            if spool is None:
+                continue
+            spool.close()
+            os.remove(spool.name)
+
+        # Readers never see a partially written index
+        os.replace(tmp, self.path)
+
+
+class StringTable:
+    # Sorted strings stored as an offsets array plus a utf-8 blob
+    def __init__(self, offsets: memoryview, blob: memoryview) -> None:
+        self.offsets: memoryview = offsets
+        self.blob: memoryview = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get_bytes(self, i: int) -> bytes:
+        return bytes(self.blob[self.offsets[i] : self.offsets[i + 1]])
+
+    def get(self, i: int) -> str:
+        return self.get_bytes(i).decode()
+
+    def lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, value: str) -> Optional[int]:
+        key: bytes = value.encode()
+        i: int = self.lower_bound(key)
+        if i < len(self) and self.get_bytes(i) == key:
+            return i
+        return None
+
+
+class IndexReader:
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+
+        with open(path, "rb") as fd:
+            self.mm: mmap.mmap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf: memoryview = memoryview(self.mm)
+
+        magic, version, count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an index file")
+        if version != VERSION:
+            raise ValueError(f"{path} has index version {version}, rebuild the index")
+
+        self.sections: Dict[bytes, Tuple[int, int]] = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(self.mm, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b"\0")] = (offset, length)
+
+        self.docs: memoryview = self.section(DOCS)
+        self.doc_lengths: memoryview = self.section(DOC_LENGTHS).cast("I")
+        self.term_offsets: memoryview = self.section(TERM_OFFSETS).cast("Q")
+        self.terms: memoryview = self.section(TERMS)
+        self.posting_offsets: memoryview = self.section(POSTING_OFFSETS).cast("Q")
+        self.posting_data: memoryview = self.section(POSTINGS)
+        self.doc_freqs: memoryview = self.section(DOC_FREQS).cast("I")
+        self.gram_offsets: memoryview = self.section(GRAM_OFFSETS).cast("Q")
+        self.grams: memoryview = self.section(GRAMS)
+        self.gram_posting_offsets: memoryview = self.section(GRAM_POSTING_OFFSETS).cast("Q")
+        self.gram_postings: memoryview = self.section(GRAM_POSTINGS)
+
+        # Segments written before the doc store have no metadata sections
+        self.doc_times: Optional[memoryview] = None
+        self.doc_meta_offsets: Optional[memoryview] = None
+        self.doc_meta: Optional[memoryview] = None
+        if DOC_META in self.sections:
+            self.doc_times = self.section(DOC_TIMES).cast("q")
+            self.doc_meta_offsets = self.section(DOC_META_OFFSETS).cast("Q")
+            self.doc_meta = self.section(DOC_META)
+
+        self.prefix_table: Optional[StringTable] = None
+        self.suggest_offsets: Optional[memoryview] = None
+        self.suggest_ids: Optional[memoryview] = None
+        if SUGGEST in self.sections:
+            self.prefix_table = StringTable(
+                self.section(PREFIX_OFFSETS).cast("Q"), self.section(PREFIXES)
+            )
+            self.suggest_offsets = self.section(SUGGEST_OFFSETS).cast("Q")
+            self.suggest_ids = self.section(SUGGEST)
+
+        self.positional: bool = POSITIONS in self.sections
+        self.position_offsets: Optional[memoryview] = None
+        self.position_data: Optional[memoryview] = None
+        self.skip_offsets: Optional[memoryview] = None
+        self.skips: Optional[memoryview] = None
+        if self.positional:
+            self.position_offsets = self.section(POSITION_OFFSETS).cast("Q")
+            self.position_data = self.section(POSITIONS)
+            self.skip_offsets = self.section(SKIP_OFFSETS).cast("Q")
+            self.skips = self.section(SKIPS).cast("Q")
+
+        self.has_text: bool = DOC_TEXT in self.sections
+        self.text_offsets: Optional[memoryview] = None
+        self.text_data: Optional[memoryview] = None
+        if self.has_text:
+            self.text_offsets = self.section(DOC_TEXT_OFFSETS).cast("Q")
+            self.text_data = self.section(DOC_TEXT)
+
+        self.term_table: StringTable = StringTable(self.term_offsets, self.terms)
+        self.gram_table: StringTable = StringTable(self.gram_offsets, self.grams)
+
+        self.n_docs: int = len(self.docs) // HASH_SIZE
+        self.n_terms: int = len(self.doc_freqs)
+        if TOTAL_LENGTH in self.sections:
+            (total_length,) = struct.unpack_from("<Q", self.mm, self.sections[TOTAL_LENGTH][0])
+        else:
+            total_length = sum(self.doc_lengths)
+        self.avg_length: float = total_length / max(self.n_docs, 1)
+
+    def section(self, name: bytes) -> memoryview:
+        offset, length = self.sections[name]
+        return self.buf[offset : offset + length]
+
+    def term(self, term_id: int) -> str:
+        return self.term_table.get(term_id)
+
+    def iter_terms(self) -> Iterator[Tuple[int, str]]:
+        for term_id in range(self.n_terms):
+            yield term_id, self.term(term_id)
+
+    def find(self, term: str) -> Optional[int]:
+        return self.term_table.find(term)
+
+    def gram_terms(self, gram: str) -> List[int]:
+        gram_id: Optional[int] = self.gram_table.find(gram)
+        if gram_id is None:
+            return []
+
+        values = decode_varints(
+            self.gram_postings,
+            self.gram_posting_offsets[gram_id],
+            self.gram_posting_offsets[gram_id + 1],
+        )
+        return delta_decode(values)
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_TOP) -> List[Tuple[str, int]]:
+        # (term, document frequency) of the most frequent terms starting with prefix
+        if self.prefix_table is not None:
+            prefix_id: Optional[int] = self.prefix_table.find(prefix)
+            if prefix_id is not None:
+                term_ids = decode_varints(
+                    self.suggest_ids,
+                    self.suggest_offsets[prefix_id],
+                    self.suggest_offsets[prefix_id + 1],
+                )
+                return [
+                    (self.term(term_id), self.doc_freqs[term_id]) for term_id in term_ids[:limit]
+                ]
+
+        # Not in the table: at most SUGGEST_SCAN terms share the prefix
+        scan: int = SUGGEST_SCAN if self.prefix_table is not None else LEGACY_SUGGEST_SCAN
+        key: bytes = prefix.encode()
+        start: int = self.term_table.lower_bound(key)
+        end: int = min(start + scan, self.n_terms)
+        matches = []
+        for term_id in range(start, end):
+            if not self.term_table.get_bytes(term_id).startswith(key):
+                break
+            matches.append(term_id)
+
+        top = heapq.nlargest(limit, matches, key=self.doc_freqs.__getitem__)
+        return [(self.term(term_id), self.doc_freqs[term_id]) for term_id in top]
+
+    def postings(self, term_id: int) -> Tuple[List[int], List[int]]:
+        values = decode_varints(
+            self.posting_data,
+            self.posting_offsets[term_id],
+            self.posting_offsets[term_id + 1],
+        )
+        return decode_postings(values)
+
+    def positions(self, term_id: int) -> Optional[List[List[int]]]:
+        if not self.positional:
+            return None
+
+        values = decode_varints(
+            self.position_data,
+            self.position_offsets[term_id],
+            self.position_offsets[term_id + 1],
+        )
+        return decode_positions(values)
+
+    def cursor(self, term_id: int) -> "PostingCursor":
+        return PostingCursor(self, term_id)
+
+    def doc_ids(self, term_id: int) -> List[int]:
+        return self.postings(term_id)[0]
+
+    def doc_hash(self, doc_id: int) -> str:
+        return self.docs[doc_id * HASH_SIZE : (doc_id + 1) * HASH_SIZE].hex()
+
+    def doc_text_raw(self, doc_id: int) -> Optional[bytes]:
+        # Compressed, as stored (copied as is by merges)
+        if not self.has_text:
+            return None
+
+        start, end = self.text_offsets[doc_id], self.text_offsets[doc_id + 1]
+        return bytes(self.text_data[start:end]) if start != end else None
+
+    def doc_text(self, doc_id: int) -> Optional[str]:
+        raw: Optional[bytes] = self.doc_text_raw(doc_id)
+        return zlib.decompress(raw).decode() if raw is not None else None
+
+    def doc_info(self, doc_id: int) -> Optional[DocInfo]:
+        if self.doc_meta is None:
+            return None
+
+        start, end = self.doc_meta_offsets[doc_id], self.doc_meta_offsets[doc_id + 1]
+        if start == end:
+            return None
+
+        url, profile, title = bytes(self.doc_meta[start:end]).decode().split("\0", 2)
+        return url, self.doc_times[doc_id], profile, title
+
+    def close(self):
+        # Views must be released before the map can be closed
+        for view in (
+            self.docs,
+            self.doc_lengths,
+            self.term_offsets,
+            self.terms,
+            self.posting_offsets,
+            self.posting_data,
+            self.doc_freqs,
+            self.gram_offsets,
+            self.grams,
+            self.gram_posting_offsets,
+            self.gram_postings,
+            self.doc_times,
+            self.doc_meta_offsets,
+            self.doc_meta,
+            self.prefix_table.offsets if self.prefix_table is not None else None,
+            self.prefix_table.blob if self.prefix_table is not None else None,
+            self.suggest_offsets,
+            self.suggest_ids,
+            self.position_offsets,
+            self.position_data,
+            self.skip_offsets,
+            self.skips,
+            self.text_offsets,
+            self.text_data,
+            self.buf,
+        ):
+            if view is not None:
+                view.release()
+        self.mm.close()
+
+
+class PostingCursor:
+    # Walks one term's postings of a positional segment, skipping whole blocks
+    def __init__(self, reader: IndexReader, term_id: int) -> None:
+        self.reader: IndexReader = reader
+        self.term_id: int = term_id
+
+        first, last = reader.skip_offsets[term_id], reader.skip_offsets[term_id + 1]
+        self.skips: List[Tuple[int, int, int]] = [
+            tuple(reader.skips[i * 3 : i * 3 + 3]) for i in range(first, last)
+        ]
+        # Doc id before each block: block b holds docs in (previous[b], previous[b + 1]]
+        self.previous: List[int] = [skip[0] for skip in self.skips]
+
+        self.block: int = -1
+        self.doc_ids: List[int] = []
+        self.freqs: List[int] = []
+        self.block_positions: List[List[int]] = []
+        self.index: int = 0
+
+    def load(self, block: int):
+        reader: IndexReader = self.reader
+        previous, post_start, pos_start = self.skips[block]
+        if block + 1 < len(self.skips):
+            _, post_end, pos_end = self.skips[block + 1]
+        else:
+            post_end = reader.posting_offsets[self.term_id + 1] - reader.posting_offsets[self.term_id]
+            pos_end = reader.position_offsets[self.term_id + 1] - reader.position_offsets[self.term_id]
+
+        base: int = reader.posting_offsets[self.term_id]
+        values = decode_varints(reader.posting_data, base + post_start, base + post_end)
+        self.doc_ids = values[0::2]
+        self.freqs = values[1::2]
+        for i, delta in enumerate(self.doc_ids):
+            previous += delta
+            self.doc_ids[i] = previous
+
+        base = reader.position_offsets[self.term_id]
+        self.block_positions = decode_positions(
+            decode_varints(reader.position_data, base + pos_start, base + pos_end)
+        )
+        self.block = block
+        self.index = 0
+
+    def advance(self, target: int) -> Optional[int]:
+        # First doc id >= target, or None once the postings run out
+        if not self.skips:
+            return None
+
+        block: int = max(bisect_left(self.previous, target) - 1, 0, self.block)
+        if block != self.block:
+            self.load(block)
+
+        while True:
+            self.index = bisect_left(self.doc_ids, target, self.index)
+            if self.index < len(self.doc_ids):
+                return self.doc_ids[self.index]
+            if self.block + 1 >= len(self.skips):
+                return None
+            self.load(self.block + 1)
+
+    def freq(self) -> int:
+        return self.freqs[self.index]
+
+    def positions(self) -> List[int]:
+        return self.block_positions[self.index]
@@ -0,0 +1,160 @@
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+logger: logging.Logger = logging.getLogger("PackStore")
+
+# Record header in a segment: sha1 digest, payload length
+RECORD = struct.Struct("<20sI")
+# Index entry: sha1 digest, segment, payload offset, payload length
+ENTRY = struct.Struct("<20sIQI")
+
+INDEX_NAME = "pack.idx"
+SEGMENT_FORMAT = "pack-{:06d}.pack"
+SEGMENT_RE = re.compile(r"^pack-(\d{6})\.pack$")
+
+
+# Content addressed page cache kept in large append-only segment files.
+# `pack.idx` logs (hash, segment, offset, length); an entry is only written
+# after its record, so a crash can leave an unindexed tail in a segment but
+# never an entry pointing at missing data. Only one process may write at a time.
+class PackStore:
+    def __init__(self, root: str, segment_size: int = 256 << 20) -> None:
+        self.root: str = root
+        self.segment_size: int = segment_size
+
+        self.index: Dict[bytes, Tuple[int, int, int]] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.maps: Dict[int, mmap.mmap] = {}
+
+        # Writer state (opened on first `put`)
+        self.segment: int = 0
+        self.segment_fd: Optional[BinaryIO] = None
+        self.index_fd: Optional[BinaryIO] = None
+
+        self.load()
+
+    def load(self):
+        segments: List[int] = [
+            int(m.group(1))
+            for m in map(SEGMENT_RE.match, os.listdir(self.root))
+            if m
+        ]
+        self.segment = max(segments, default=0)
+
+        index_path: str = os.path.join(self.root, INDEX_NAME)
+        if not os.path.exists(index_path):
+            return
+
+        with open(index_path, "rb") as fd:
+            data: bytes = fd.read()
+
+        whole: int = len(data) - len(data) % ENTRY.size
+        for digest, segment, offset, length in ENTRY.iter_unpack(data[:whole]):
+            self.index[digest] = (segment, offset, length)
+
+        if whole != len(data):
+            logger.warning("Ignoring partial index entry in %s", index_path)
+
+    def __contains__(self, hash_str: str) -> bool:
+        return bytes.fromhex(hash_str) in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def hashes(self) -> Iterator[str]:
+        return (digest.hex() for digest in list(self.index))
+
+    def locate(self, hash_str: str) -> Tuple[int, int]:
+        segment, offset, _ = self.index[bytes.fromhex(hash_str)]
+        return segment, offset
+
+    def size(self) -> int:
+        return sum(
+            os.path.getsize(os.path.join(self.root, name))
+            for name in os.listdir(self.root)
+            if SEGMENT_RE.match(name) or name == INDEX_NAME
+        )
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.root, SEGMENT_FORMAT.format(segment))
+
+    def put(self, hash_str: str, data: bytes) -> bool:
+        digest: bytes = bytes.fromhex(hash_str)
+
+        with self.lock:
+            if digest in self.index:
+                return False
+
+            if self.index_fd is None:
+                self.index_fd = open(os.path.join(self.root, INDEX_NAME), "ab")
+                self.index_fd.truncate(
+                    self.index_fd.tell() - self.index_fd.tell() % ENTRY.size
+                )
+
+            if self.segment_fd is None:
+                self.segment_fd = open(self.segment_path(self.segment), "ab")
+
+            # Roll over to a new segment
+            end: int = self.segment_fd.tell()
+            if end and end + RECORD.size + len(data) > self.segment_size:
+                self.segment_fd.close()
+                self.segment += 1
+                self.segment_fd = open(self.segment_path(self.segment), "ab")
+
+            offset: int = self.segment_fd.tell() + RECORD.size
+            self.segment_fd.write(RECORD.pack(digest, len(data)))
+            self.segment_fd.write(data)
+            self.segment_fd.flush()
+
+            self.index_fd.write(ENTRY.pack(digest, self.segment, offset, len(data)))
+            self.index_fd.flush()
+
+            self.index[digest] = (self.segment, offset, len(data))
+            return True
+
+    def map_segment(self, segment: int, end: int) -> mmap.mmap:
+        mapped: Optional[mmap.mmap] = self.maps.get(segment)
+
+        # Remap segments that grew since they were mapped
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+
+            with open(self.segment_path(segment), "rb") as fd:
+                mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = mapped
+
+        return mapped
+
+    def get(self, hash_str: str) -> bytes:
+        segment, offset, length = self.index[bytes.fromhex(hash_str)]
+        return self.map_segment(segment, offset + length)[offset : offset + length]
+
+    def iterate(self) -> Iterator[Tuple[str, bytes]]:
+        # Sequential scan of every segment, in write order
+        positions: Dict[int, List[Tuple[int, bytes]]] = {}
+        for digest, (segment, offset, _) in list(self.index.items()):
+            positions.setdefault(segment, []).append((offset, digest))
+
+        for segment in sorted(positions):
+            with open(self.segment_path(segment), "rb", buffering=1 << 20) as fd:
+                for offset, digest in sorted(positions[segment]):
+                    fd.seek(offset - RECORD.size)
+                    _, length = RECORD.unpack(fd.read(RECORD.size))
+                    yield digest.hex(), fd.read(length)
+
+    def close(self):
+        with self.lock:
+            for fd in (self.segment_fd, self.index_fd):
+                if fd is not None:
+                    fd.close()
+            self.segment_fd = self.index_fd = None
+
+        for mapped in self.maps.values():
+            mapped.close()
+        self.maps.clear()
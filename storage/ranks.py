@@ -0,0 +1,32 @@
+import os
+from array import array
+from typing import Optional, Tuple
+
+# Link analysis scores of one segment, aligned with its doc ids:
+# f32 authority (0..1) per document, then u32 in-degree per document
+RANK_SUFFIX = ".rank"
+
+
+def rank_path(segment_path: str) -> str:
+    return segment_path + RANK_SUFFIX
+
+
+def write_ranks(segment_path: str, authority: array, in_degree: array):
+    path: str = rank_path(segment_path)
+    with open(path + ".tmp", "wb") as fd:
+        authority.tofile(fd)
+        in_degree.tofile(fd)
+    os.replace(path + ".tmp", path)
+
+
+def read_ranks(segment_path: str, n_docs: int) -> Optional[Tuple[array, array]]:
+    path: str = rank_path(segment_path)
+    if not os.path.exists(path):
+        return None
+
+    authority: array = array("f")
+    in_degree: array = array("I")
+    with open(path, "rb") as fd:
+        authority.fromfile(fd, n_docs)
+        in_degree.fromfile(fd, n_docs)
+    return authority, in_degree
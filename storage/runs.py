@@ -0,0 +1,126 @@
+import heapq
+import os
+import struct
+from itertools import groupby
+from operator import itemgetter
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from storage.index_file import (
+    decode_positions,
+    decode_postings,
+    decode_varints,
+    encode_positions,
+    encode_postings,
+)
+
+# Sorted partial postings written by index workers.
+# Record: term length, postings length, positions length, term bytes,
+# varint (doc delta, tf) pairs, then positions (empty for non positional runs)
+RECORD = struct.Struct("<HII")
+
+# Side file of a run: zlib compressed page text per document, length prefixed
+TEXT_RECORD = struct.Struct("<I")
+
+# Runs merged at once (bounds open files)
+MERGE_FAN_IN = 64
+
+Postings = Tuple[List[int], List[int], Optional[List[List[int]]]]
+
+
+def write_run(path: str, postings: Dict[str, Postings]):
+    with open(path, "wb", buffering=1 << 20) as fd:
+        append_run(fd, ((term, postings[term]) for term in sorted(postings)))
+
+
+def write_texts(path: str, texts: List[bytes]):
+    with open(path, "wb", buffering=1 << 20) as fd:
+        for text in texts:
+            fd.write(TEXT_RECORD.pack(len(text)))
+            fd.write(text)
+
+
+def read_texts(path: str) -> Iterator[bytes]:
+    with open(path, "rb", buffering=1 << 20) as fd:
+        while True:
+            header: bytes = fd.read(TEXT_RECORD.size)
+            if not header:
+                return
+            yield fd.read(TEXT_RECORD.unpack(header)[0])
+
+
+def read_run(path: str) -> Iterator[Tuple[str, Postings]]:
+    with open(path, "rb", buffering=1 << 20) as fd:
+        while True:
+            header: bytes = fd.read(RECORD.size)
+            if not header:
+                return
+
+            term_length, data_length, positions_length = RECORD.unpack(header)
+            term: str = fd.read(term_length).decode()
+            data = memoryview(fd.read(data_length))
+            doc_ids, freqs = decode_postings(decode_varints(data, 0, data_length))
+
+            positions: Optional[List[List[int]]] = None
+            if positions_length:
+                data = memoryview(fd.read(positions_length))
+                positions = decode_positions(decode_varints(data, 0, positions_length))
+            yield term, (doc_ids, freqs, positions)
+
+
+def tagged(run: int, path: str) -> Iterator[Tuple[str, int, Postings]]:
+    for term, postings in read_run(path):
+        yield term, run, postings
+
+
+def merge_runs(paths: Sequence[str]) -> Iterator[Tuple[str, Postings]]:
+    # Runs hold consecutive doc id ranges in order, so concatenating
+    # postings in run order keeps them sorted
+    streams = [tagged(run, path) for run, path in enumerate(paths)]
+    for term, group in groupby(heapq.merge(*streams), key=itemgetter(0)):
+        doc_ids: List[int] = []
+        freqs: List[int] = []
+        positions: Optional[List[List[int]]] = []
+        for _, _, (ids, tfs, run_positions) in group:
+            doc_ids.extend(ids)
+            freqs.extend(tfs)
+            if run_positions is None:
+                positions = None
+            elif positions is not None:
+                positions.extend(run_positions)
+        yield term, (doc_ids, freqs, positions)
+
+
+def reduce_runs(paths: List[str], work_dir: str) -> List[str]:
+    # Merge passes until at most MERGE_FAN_IN runs are left
+    level = 0
+    while len(paths) > MERGE_FAN_IN:
+        merged: List[str] = []
+        for i in range(0, len(paths), MERGE_FAN_IN):
+            group: List[str] = paths[i : i + MERGE_FAN_IN]
+            out: str = os.path.join(work_dir, f"merge-{level}-{i // MERGE_FAN_IN:06d}.run")
+
+            with open(out, "wb", buffering=1 << 20) as fd:
+                append_run(fd, merge_runs(group))
+
+            for path in group:
+                os.remove(path)
+            merged.append(out)
+
+        paths = merged
+        level += 1
+    return paths
+
+
+def append_run(fd: BinaryIO, records: Iterator[Tuple[str, Postings]]):
+    for term, postings in records:
+        encoded: bytes = term.encode()
+        if len(encoded) > 0xFFFF:
+            continue
+
+        doc_ids, freqs, positions = postings
+        data: bytearray = encode_postings(doc_ids, freqs)
+        position_data: bytearray = encode_positions(positions or (), bytearray())
+        fd.write(RECORD.pack(len(encoded), len(data), len(position_data)))
+        fd.write(encoded)
+        fd.write(data)
+        fd.write(position_data)
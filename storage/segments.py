@@ -0,0 +1,92 @@
+import heapq
+import os
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterator, List, Tuple
+
+import ujson as json
+
+from storage.index_file import IndexReader, IndexWriter
+
+MANIFEST_NAME = "manifest.json"
+
+# Fewest segments merged at once when too many pile up
+MERGE_FACTOR = 4
+
+
+class SegmentManifest:
+    # Live segments of an index directory; replaced atomically on every change
+    def __init__(self, root: str) -> None:
+        self.root: str = root
+        self.generation: int = 0
+        self.segments: List[str] = []
+
+    @classmethod
+    def load(cls, root: str) -> "SegmentManifest":
+        manifest = cls(root)
+        path: str = os.path.join(root, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path) as fd:
+                data = json.load(fd)
+            manifest.generation = data["generation"]
+            manifest.segments = data["segments"]
+        return manifest
+
+    def path(self, segment: str) -> str:
+        return os.path.join(self.root, segment)
+
+    def paths(self) -> List[str]:
+        return [self.path(segment) for segment in self.segments]
+
+    def new_segment(self) -> str:
+        self.generation += 1
+        return f"seg-{self.generation:06d}.idx"
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        path: str = os.path.join(self.root, MANIFEST_NAME)
+        with open(path + ".tmp", "w") as fd:
+            json.dump({"generation": self.generation, "segments": self.segments}, fd)
+        os.replace(path + ".tmp", path)
+
+
+def merge_window(sizes: List[int], count: int) -> int:
+    # Start of the `count` adjacent segments with the fewest bytes. New segments
+    # are appended small, so small recent ones merge together and large old
+    # segments are only rewritten once enough data has piled up next to them
+    totals: List[int] = [sum(sizes[i : i + count]) for i in range(len(sizes) - count + 1)]
+    return totals.index(min(totals))
+
+
+def segment_terms(segment: int, reader: IndexReader) -> Iterator[Tuple[str, int, int]]:
+    for term_id, term in reader.iter_terms():
+        yield term, segment, term_id
+
+
+def merge_segments(readers: List[IndexReader], writer: IndexWriter):
+    # Documents are concatenated, so segment i's doc ids move up by bases[i]
+    bases: List[int] = []
+    for reader in readers:
+        bases.append(len(writer.doc_lengths))
+        for doc_id in range(reader.n_docs):
+            writer.add_document(
+                reader.doc_hash(doc_id),
+                reader.doc_lengths[doc_id],
+                reader.doc_info(doc_id),
+                reader.doc_text_raw(doc_id),
+            )
+
+    # k-way merge of the sorted term dictionaries
+    streams = [segment_terms(i, reader) for i, reader in enumerate(readers)]
+    for term, group in groupby(heapq.merge(*streams), key=itemgetter(0)):
+        doc_ids: List[int] = []
+        freqs: List[int] = []
+        positions: List[List[int]] = []
+        for _, segment, term_id in group:
+            ids, tfs = readers[segment].postings(term_id)
+            doc_ids.extend(bases[segment] + doc_id for doc_id in ids)
+            freqs.extend(tfs)
+            if writer.positional:
+                positions.extend(readers[segment].positions(term_id))
+
+        writer.add_term(term, doc_ids, freqs, positions if writer.positional else None)